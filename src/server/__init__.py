@@ -1,8 +1,11 @@
 from .request import Request  # noqa: F401
-from .render import file, text, redirect, attachment  # noqa: F401
+from .headers import Headers  # noqa: F401
+from .render import file, text, redirect, attachment, stream  # noqa: F401
 from .server import Server  # noqa: F401
+from .async_server import AsyncServer  # noqa: F401
 from .response_codes import ResponseCodes  # noqa: F401
 from .response_messages import ResponseMessages  # noqa: F401
-from .response import Response  # noqa: F401
+from .response import Response, FileResponse  # noqa: F401
 from .cache import Cache, CacheItem  # noqa: F401
-from .sessions import Session  # noqa: F401
\ No newline at end of file
+from .sessions import Session, SessionBackend, MemorySessionBackend, SQLiteSessionBackend  # noqa: F401
+from .multipart import Part, MultipartError  # noqa: F401
\ No newline at end of file
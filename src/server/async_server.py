@@ -0,0 +1,369 @@
+import asyncio
+import tempfile
+import threading
+import concurrent.futures
+
+from . import request
+from . import response
+from . import server
+
+class AsyncServer(server.Server):
+    '''HTTP server handling every connection on a single asyncio event loop.
+    Routes may be defined with "async def", other routes run in a thread pool
+    of max_workers threads so they never block the event loop.
+    Request bodies are received into a temporary file before the route is called,
+    kept in memory up to 1 MiB and written to disk beyond, as reading them on demand
+    would block the event loop. Only Server streams them from the connection.'''
+
+    def _start_listening(self) -> None:
+        '''Starts the event loop in a new thread and waits until it listens.'''
+
+        self._loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+
+        self._executor: concurrent.futures.ThreadPoolExecutor = \
+        concurrent.futures.ThreadPoolExecutor(max_workers = self._max_workers)
+
+        self._started: threading.Event = threading.Event()
+
+        self._closing: asyncio.Event = asyncio.Event()
+
+        self._connection_tasks: set[asyncio.Task] = set()
+
+        self._idle_connections: set[asyncio.Task] = set()
+
+        self._loop_thread: threading.Thread = \
+        threading.Thread(target = self._loop.run_until_complete,
+                         args = (self._listen(),),
+                         daemon = True)
+
+        self._loop_thread.start()
+
+        self._started.wait()
+
+    def _stop_listening(self) -> None:
+        '''Stops accepting connections and waits for the event loop to finish
+        the open connections, then shuts the thread pool down.'''
+
+        self._loop.call_soon_threadsafe(self._closing.set)
+
+        self._loop_thread.join()
+
+    async def _listen(self) -> None:
+        '''Listens for incoming connections and creates a task to handle each one.
+        Once stopping, idle connections are closed and the others are given
+        shutdown_timeout seconds to finish before they are cancelled.'''
+
+        try:
+
+            self._socket: asyncio.Server = await asyncio.start_server(
+                          self._serve_connection,
+                          host = self._host,
+                          port = self._port,
+                          ssl = self._ssl_context,
+                          backlog = self._backlog if self._backlog is not None else 100,
+                          reuse_address = True,
+                          reuse_port = self._reuse_port or None)
+
+        finally:
+
+            self._started.set()
+
+        if self._logger:
+
+            self._logger.info(f'Server hosted on http{"s" if self._ssl_context else ""}\
+://{self._host}:{self._port}.')
+
+        await self._closing.wait()
+
+        self._socket.close()
+
+        await asyncio.sleep(0)
+
+        for task in self._idle_connections:
+
+            task.cancel()
+
+        if self._connection_tasks:
+
+            await asyncio.wait(self._connection_tasks,
+                               timeout = self._shutdown_timeout)
+
+        for task in self._connection_tasks:
+
+            task.cancel()
+
+        await asyncio.gather(*self._connection_tasks,
+                             return_exceptions = True)
+
+        self._executor.shutdown(wait = False)
+
+    async def _serve_connection(self,
+                                reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter) -> None:
+        '''Handles a connection while keeping count of the open connections.'''
+
+        task = asyncio.current_task()
+
+        self._connection_tasks.add(task)
+
+        with self._open_connections_lock:
+
+            self._open_connections += 1
+
+        try:
+
+            await self._handle_request(reader = reader,
+                                       writer = writer)
+
+        except asyncio.CancelledError:
+
+            if self._logger:
+
+                self._logger.debug('Connection closed as the server is stopping.')
+
+        finally:
+
+            writer.close()
+
+            self._connection_tasks.discard(task)
+
+            self._idle_connections.discard(task)
+
+            with self._open_connections_lock:
+
+                self._open_connections -= 1
+
+    async def _handle_request(self,
+                              reader: asyncio.StreamReader,
+                              writer: asyncio.StreamWriter) -> None:
+        '''Handles a request from a client.
+        If an error occurs once the response started being sent, the connection
+        is only closed, as a 500 can no longer be sent in its place.'''
+
+        address = writer.get_extra_info('peername')
+
+        parsed_request = request.Request()
+
+        task = asyncio.current_task()
+
+        while True:
+
+            response_started = False
+
+            try:
+
+                if self._closing.is_set():
+
+                    writer.close()
+
+                    return None
+
+                self._idle_connections.add(task)
+
+                try:
+
+                    raw_request = await asyncio.wait_for(
+                                  reader.readuntil(b'\r\n\r\n'),
+                                  timeout = self._keep_alive_timeout)
+
+                except asyncio.IncompleteReadError:
+
+                    if self._logger:
+
+                        self._logger.debug(f'Connection closed by client \
+{address[0]}:{address[1]}.')
+
+                    writer.close()
+
+                    return None
+
+                finally:
+
+                    self._idle_connections.discard(task)
+
+                try:
+
+                    parsed_request = request.Request.from_bytestring(address = address,
+                                     request = raw_request)
+
+                except Exception:
+
+                    if self._logger:
+
+                        self._logger.error(f'Invalid request from \
+{address[0]}:{address[1]}, closing connection.')
+
+                    writer.close()
+
+                    return None
+
+                if content_length:=parsed_request.headers.get('Content-Length'):
+
+                    if not (content_length:=content_length.strip()).isascii() \
+                       or not content_length.isdigit():
+
+                        if self._logger:
+
+                            self._logger.error(f'Invalid Content-Length from \
+{address[0]}:{address[1]}, closing connection.')
+
+                        writer.write(self._bad_request_response)
+
+                        await writer.drain()
+
+                        writer.close()
+
+                        return None
+
+                    content_length = int(content_length)
+
+                    if self._max_body_size is not None \
+                       and content_length > self._max_body_size:
+
+                        if self._logger:
+
+                            self._logger.warning(f'Request body from \
+{address[0]}:{address[1]} is too large, closing connection.')
+
+                        writer.write(self._too_large_response)
+
+                        await writer.drain()
+
+                        writer.close()
+
+                        return None
+
+                    parsed_request._body = None
+
+                    parsed_request._spooled = await self._spool_body(reader,
+                                                                     content_length)
+
+                if self._logger:
+
+                    self._logger.debug(f'Recieved {parsed_request.method} request from \
+{address[0]}:{address[1]} for {parsed_request.path if parsed_request.path else "/"}')
+
+                message = await self._get_route_async(path = parsed_request.path,
+                                                      request = parsed_request,
+                                                      executor = self._executor)
+
+                if message.chunked and parsed_request.version < 1.1:
+
+                    message.headers.pop('Transfer-Encoding', None)
+
+                    message.headers.pop('transfer-encoding', None)
+
+                response_started = True
+
+                await self._send(writer = writer,
+                                 message = message)
+
+                if self._logger:
+
+                    self._logger.debug(f'Sent {parsed_request.method} response to \
+{address[0]}:{address[1]} for {parsed_request.path if parsed_request.path else "/"}')
+
+                if not parsed_request.headers.get('Connection') == 'keep-alive' \
+                   or (message.is_streamed and not message.chunked \
+                       and 'Content-Length' not in message.headers):
+
+                    writer.close()
+
+                    if self._logger:
+
+                        self._logger.debug(f'Connection closed with \
+{address[0]}:{address[1]} by client.')
+
+                    return None
+
+            except (TimeoutError, asyncio.TimeoutError):
+
+                if self._logger:
+
+                    self._logger.debug(f'Connection with \
+{address[0]}:{address[1]} timed out.')
+
+                writer.close()
+
+                return None
+
+            except Exception as e:
+
+                if self._logger:
+
+                    self._logger.error(f'Error while handling request from \
+{address[0]}:{address[1]} : "{e}".')
+
+                try:
+
+                    if not response_started:
+
+                        await self._send(writer = writer,
+                                         message = await self._get_route_async(
+                                                   path = self._500route,
+                                                   request = parsed_request,
+                                                   executor = self._executor))
+
+                    writer.close()
+
+                except Exception:
+
+                    pass
+
+                return None
+
+    async def _spool_body(self,
+                          reader: asyncio.StreamReader,
+                          length: int,
+                          max_size: int = 1048576) -> tempfile.SpooledTemporaryFile:
+        '''Receives a request body in chunks into a temporary file, which is kept
+        in memory until it grows larger than max_size bytes.
+        The returned file is positioned at its start.'''
+
+        spooled = tempfile.SpooledTemporaryFile(max_size = max_size)
+
+        while length:
+
+            if not (chunk:=await reader.read(min(65536, length))):
+
+                raise ConnectionError('Connection closed before the body was received.')
+
+            spooled.write(chunk)
+
+            length -= len(chunk)
+
+        spooled.seek(0)
+
+        return spooled
+
+    async def _send(self,
+                    writer: asyncio.StreamWriter,
+                    message: response.Response) -> None:
+        '''Sends a response on a connection, streaming its body if needed.
+        File responses are sent with the event loop's sendfile, which falls back
+        to reading the file in chunks on TLS connections. Raises an OSError if the
+        file is shorter than its Content-Length.'''
+
+        if isinstance(message, response.FileResponse) and message.is_streamed:
+
+            writer.write(message._head())
+
+            await writer.drain()
+
+            with open(message.filepath, 'rb') as file:
+
+                if await asyncio.get_running_loop().sendfile(writer.transport,
+                                                             file,
+                                                             offset = message.offset,
+                                                             count = message.length) \
+                   < message.length:
+
+                    raise OSError(f'File "{message.filepath}" shrank while it was sent.')
+
+            return None
+
+        async for data in message._aiter_bytes(executor = self._executor):
+
+            writer.write(data)
+
+            await writer.drain()
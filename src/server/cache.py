@@ -1,88 +1,663 @@
+import collections
+import concurrent.futures
+import heapq
+import itertools
+import sys
 import threading
-from typing import Any, Self
+import time
+from typing import Any, Callable, Self
+
+class _LRU:
+    '''Least recently used eviction order.'''
+
+    def __init__(self,
+                 max_items: int = None) -> None:
+        '''Initializes the LRU policy class.'''
+
+        self._order: collections.OrderedDict[str, None] = collections.OrderedDict()
+
+    def insert(self,
+               key: str) -> None:
+        '''Records a new key.'''
+
+        self._order[key] = None
+
+    def access(self,
+               key: str) -> None:
+        '''Records a hit on a key.'''
+
+        self._order.move_to_end(key)
+
+    def miss(self,
+             key: str) -> None:
+        '''Records a miss on a key.'''
+
+        pass
+
+    def remove(self,
+               key: str) -> None:
+        '''Forgets a key.'''
+
+        self._order.pop(key, None)
+
+    def victim(self) -> str:
+        '''Returns the key to evict next.'''
+
+        return next(iter(self._order))
+
+    def admit(self,
+              key: str,
+              victim: str) -> bool:
+        '''Returns whether a new key may replace the victim.'''
+
+        return True
+
+class _LFU:
+    '''Least frequently used eviction order, least recently used among equals.
+    Keys are kept in buckets of equal frequency, and the buckets in a linked list
+    ordered by frequency, so every operation is O(1).'''
+
+    def __init__(self,
+                 max_items: int = None) -> None:
+        '''Initializes the LFU policy class.'''
+
+        self._frequencies: dict[str, int] = {}
+
+        self._buckets: dict[int, collections.OrderedDict[str, None]] = {}
+
+        self._lower: dict[int, int] = {}
+
+        self._higher: dict[int, int] = {}
+
+        self._min_frequency: int = None
+
+    def _link(self,
+              frequency: int,
+              lower: int) -> None:
+        '''Creates the bucket of a frequency right after the bucket of lower,
+        or first if lower is None.'''
+
+        higher = self._min_frequency if lower is None else self._higher[lower]
+
+        self._buckets[frequency] = collections.OrderedDict()
+
+        self._lower[frequency] = lower
+
+        self._higher[frequency] = higher
+
+        if lower is None:
+
+            self._min_frequency = frequency
+
+        else:
+
+            self._higher[lower] = frequency
+
+        if higher is not None:
+
+            self._lower[higher] = frequency
+
+    def _unlink(self,
+                key: str,
+                frequency: int) -> None:
+        '''Removes a key from its frequency bucket, and the bucket once it is empty.'''
+
+        bucket = self._buckets[frequency]
+
+        del bucket[key]
+
+        if bucket:
+
+            return None
+
+        del self._buckets[frequency]
+
+        lower = self._lower.pop(frequency)
+
+        higher = self._higher.pop(frequency)
+
+        if lower is None:
+
+            self._min_frequency = higher
+
+        else:
+
+            self._higher[lower] = higher
+
+        if higher is not None:
+
+            self._lower[higher] = lower
+
+    def insert(self,
+               key: str) -> None:
+        '''Records a new key.'''
+
+        self._frequencies[key] = 1
+
+        if 1 not in self._buckets:
+
+            self._link(1, None)
+
+        self._buckets[1][key] = None
+
+    def access(self,
+               key: str) -> None:
+        '''Records a hit on a key.'''
+
+        frequency = self._frequencies[key]
+
+        if frequency + 1 not in self._buckets:
+
+            self._link(frequency + 1, frequency)
+
+        self._buckets[frequency + 1][key] = None
+
+        self._frequencies[key] = frequency + 1
+
+        self._unlink(key, frequency)
+
+    def miss(self,
+             key: str) -> None:
+        '''Records a miss on a key.'''
+
+        pass
+
+    def remove(self,
+               key: str) -> None:
+        '''Forgets a key.'''
+
+        if (frequency:=self._frequencies.pop(key, None)) is None:
+
+            return None
+
+        self._unlink(key, frequency)
+
+    def victim(self) -> str:
+        '''Returns the key to evict next.'''
+
+        return next(iter(self._buckets[self._min_frequency]))
+
+    def admit(self,
+              key: str,
+              victim: str) -> bool:
+        '''Returns whether a new key may replace the victim.'''
+
+        return True
+
+class _TinyLFU(_LRU):
+    '''Least recently used eviction order, with new keys only admitted
+    if they were requested more often than the key they would evict.
+    Request frequencies are estimated with a count-min sketch whose counters
+    are halved periodically, so old popularity fades.'''
+
+    _DEPTH = 4
+
+    _MAX_COUNT = 15
+
+    def __init__(self,
+                 max_items: int = None) -> None:
+        '''Initializes the TinyLFU policy class.'''
+
+        super().__init__()
+
+        self._width: int = 1 << max(max_items or 1024, 16).bit_length()
+
+        self._sketch: list[bytearray] = [bytearray(self._width)
+                                         for _ in range(self._DEPTH)]
+
+        self._additions: int = 0
+
+        self._sample_size: int = 10 * self._width
+
+    def _record(self,
+                key: str) -> None:
+        '''Counts a request for a key in the sketch.'''
+
+        mask = self._width - 1
+
+        for row, counters in enumerate(self._sketch):
+
+            if counters[index:=hash((row, key)) & mask] < self._MAX_COUNT:
+
+                counters[index] += 1
+
+        self._additions += 1
+
+        if self._additions >= self._sample_size:
+
+            for counters in self._sketch:
+
+                counters[:] = bytes(count >> 1 for count in counters)
+
+            self._additions //= 2
+
+    def _estimate(self,
+                  key: str) -> int:
+        '''Returns the estimated request count of a key.'''
+
+        mask = self._width - 1
+
+        return min(counters[hash((row, key)) & mask]
+                   for row, counters in enumerate(self._sketch))
+
+    def insert(self,
+               key: str) -> None:
+        '''Records a new key.'''
+
+        super().insert(key)
+
+        self._record(key)
+
+    def access(self,
+               key: str) -> None:
+        '''Records a hit on a key.'''
+
+        super().access(key)
+
+        self._record(key)
+
+    def miss(self,
+             key: str) -> None:
+        '''Records a miss on a key.'''
+
+        self._record(key)
+
+    def admit(self,
+              key: str,
+              victim: str) -> bool:
+        '''Returns whether a new key may replace the victim.'''
+
+        return self._estimate(key) > self._estimate(victim)
+
+POLICIES: dict[str, type] = {
+    'lru': _LRU,
+    'lfu': _LFU,
+    'tinylfu': _TinyLFU,
+}
+
+def _sizeof(key: str,
+            value: Any) -> int:
+    '''Returns the approximate memory used by an item in bytes.'''
+
+    return sys.getsizeof(key) + sys.getsizeof(value)
 
 class Cache:
-    '''Cache class for storing items.'''
+    '''Cache class for storing items.
+    Expired items are removed lazily, when they are accessed or when their
+    deadline comes up in a heap of deadlines checked on every operation,
+    so no thread is needed per item.
+    The cache can be bounded by a number of items and an approximate size
+    in bytes, items being evicted by the chosen policy once it is full.
+    Every operation is atomic, so the cache can be shared between threads.'''
 
     def __init__(self,
                  name: str,
-                 reset_on_update: bool = False) -> None:
-        '''Initializes the cache class.'''
+                 reset_on_update: bool = False,
+                 *,
+                 max_items: int = None,
+                 max_bytes: int = None,
+                 policy: str = 'lru',
+                 sizeof: Callable[[str, Any], int] = _sizeof) -> None:
+        '''Initializes the cache class.
+
+        :param name: The name of the cache.
+        :param reset_on_update: Whether overwriting an item restarts its expiry.
+        :param max_items: The maximum number of items. None is unbounded.
+        :param max_bytes: The maximum approximate size of the items in bytes.
+        None is unbounded.
+        :param policy: The eviction policy, one of "lru", "lfu" or "tinylfu".
+        :param sizeof: Returns the approximate size of an item from its key and value.'''
+
+        if policy not in POLICIES:
+
+            raise ValueError(f'Unknown cache policy "{policy}".')
 
         self._name = name
 
         self._reset_on_update = reset_on_update
 
-        self._items = {}
+        self._max_items: int = max_items
 
-    def add(self,
-            item: 'CacheItem') -> None:
-        '''Adds an item to the cache.
-        If the item already exists, it is overwritten.'''
+        self._max_bytes: int = max_bytes
+
+        self._sizeof: Callable[[str, Any], int] = sizeof
+
+        self._policy: _LRU | _LFU | _TinyLFU = POLICIES[policy](max_items)
+
+        self._items: dict[str, CacheItem] = {}
+
+        self._deadlines: list[tuple[float, int, str]] = []
+
+        self._sequence: itertools.count = itertools.count()
+
+        self._bytes: int = 0
 
-        item._parent = self
+        self.hits: int = 0
+
+        self.misses: int = 0
+
+        self.evictions: int = 0
+
+        self.rejections: int = 0
+
+        self._lock: threading.RLock = threading.RLock()
+
+        self._pending: dict[str, concurrent.futures.Future] = {}
+
+    @property
+    def stats(self) -> dict[str, int]:
+        '''Returns the counters of the cache, to help sizing it.
+        Rejections are new items the policy did not admit in place of another.'''
+
+        with self._lock:
+
+            return {'items': len(self._items),
+                    'bytes': self._bytes,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'rejections': self.rejections}
+
+    def __len__(self) -> int:
+        '''Returns the number of items in the cache.'''
+
+        return len(self._items)
+
+    def _discard(self,
+                 key: str) -> None:
+        '''Removes an item and forgets it in the eviction policy.'''
+
+        if (item:=self._items.pop(key, None)):
+
+            self._bytes -= item._size
+
+            self._policy.remove(key)
+
+    def _make_room(self,
+                   key: str,
+                   size: int) -> bool:
+        '''Evicts items until a new item of the given size fits.
+        Returns False if the new item should not be stored.'''
+
+        while self._items and \
+              ((self._max_items is not None and len(self._items) >= self._max_items) or
+               (self._max_bytes is not None and self._bytes + size > self._max_bytes)):
+
+            victim = self._policy.victim()
+
+            if not self._policy.admit(key, victim):
+
+                self.rejections += 1
+
+                return False
+
+            self._discard(victim)
+
+            self.evictions += 1
+
+        return True
+
+    def _schedule(self,
+                  item: 'CacheItem') -> None:
+        '''Pushes the deadline of an item on the heap of deadlines.'''
+
+        if item._deadline is None:
+
+            return None
+
+        heapq.heappush(self._deadlines, (item._deadline, next(self._sequence), item.key))
+
+        if len(self._deadlines) > 64 and len(self._deadlines) > 2 * len(self._items):
+
+            self._deadlines = [(item._deadline, next(self._sequence), key)
+                               for key, item in self._items.items()
+                               if item._deadline is not None]
+
+            heapq.heapify(self._deadlines)
+
+    def _purge(self) -> None:
+        '''Removes the items whose deadline has passed.'''
+
+        now = time.monotonic()
+
+        while self._deadlines and self._deadlines[0][0] <= now:
+
+            deadline, _, key = heapq.heappop(self._deadlines)
+
+            if (item:=self._items.get(key)) and item._deadline == deadline:
+
+                self._discard(key)
+
+    def _add(self,
+             item: 'CacheItem',
+             reset: bool) -> None:
+        '''Adds an item to the cache, overwriting an existing one.
+        The expiry is restarted if reset is True, kept from the old item otherwise.'''
+
+        self._purge()
+
+        item._size = self._sizeof(item.key, item.value)
+
+        if self._max_bytes is not None and item._size > self._max_bytes:
+
+            self._discard(item.key)
+
+            return None
 
         if (old_item:=self._items.get(item.key)):
 
-            if self._reset_on_update:
+            self._bytes -= old_item._size
 
-                old_item._timer.cancel()
+            self._items[item.key] = item
+
+            self._bytes += item._size
+
+            self._policy.access(item.key)
+
+            if reset:
 
                 item._set_expire()
 
-            self._items[item.key] = item
+                self._schedule(item)
 
-        else:
+            else:
 
-            self._items[item.key] = item
+                item._deadline = old_item._deadline
+
+            while self._max_bytes is not None and self._bytes > self._max_bytes:
+
+                self._discard(self._policy.victim())
+
+                self.evictions += 1
+
+            return None
+
+        if not self._make_room(item.key, item._size):
+
+            return None
+
+        item._set_expire()
+
+        self._items[item.key] = item
+
+        self._bytes += item._size
+
+        self._policy.insert(item.key)
+
+        self._schedule(item)
+
+    def add(self,
+            item: 'CacheItem') -> None:
+        '''Adds an item to the cache.
+        If the item already exists, it is overwritten.'''
+
+        with self._lock:
 
-            item._set_expire()
+            self._add(item, self._reset_on_update)
 
     def remove(self,
                key: str) -> None:
         '''Removes an item from the cache.
         If the item does not exist, nothing happens.'''
-        
-        try:
-        
-            self._items.pop(key)
 
-        except KeyError:
+        with self._lock:
 
-            pass
+            self._discard(key)
+
+            self._purge()
 
     def get(self,
             key: str) -> Any:
         '''Gets value of an item from the cache.
         If the value of the item does not exist, returns None.'''
-        
-        if (item:=self._items.get(key)):
-        
-            return item.value
-        
-        return None
-    
+
+        with self._lock:
+
+            self._purge()
+
+            if (item:=self._items.get(key)):
+
+                self.hits += 1
+
+                self._policy.access(key)
+
+                return item.value
+
+            self.misses += 1
+
+            self._policy.miss(key)
+
+            return None
+
+    def get_or_set(self,
+                   key: str,
+                   factory: Callable[[], Any],
+                   expire: int | float = 0,
+                   *,
+                   stale_while_revalidate: int | float = 0) -> Any:
+        '''Gets the value of an item, computing and adding it with factory if it is missing.
+        Only one thread computes a missing value, the others wait for its result,
+        or get its exception.
+
+        :param key: The key of the item.
+        :param factory: Returns the value of the item.
+        :param expire: The time in seconds the value is fresh. 0 never expires.
+        :param stale_while_revalidate: The time in seconds an expired value is still
+        returned while it is computed again in the background.'''
+
+        with self._lock:
+
+            self._purge()
+
+            if (item:=self._items.get(key)):
+
+                self.hits += 1
+
+                self._policy.access(key)
+
+                if item._fresh_until is not None and item._fresh_until <= time.monotonic() \
+                   and key not in self._pending:
+
+                    self._pending[key] = concurrent.futures.Future()
+
+                    threading.Thread(target = self._revalidate,
+                                     args = (key, factory, expire, stale_while_revalidate),
+                                     daemon = True).start()
+
+                return item.value
+
+            self.misses += 1
+
+            self._policy.miss(key)
+
+            if not (pending:=self._pending.get(key)):
+
+                self._pending[key] = concurrent.futures.Future()
+
+        if pending:
+
+            return pending.result()
+
+        return self._compute(key, factory, expire, stale_while_revalidate)
+
+    def _revalidate(self,
+                    key: str,
+                    factory: Callable[[], Any],
+                    expire: int | float,
+                    stale_while_revalidate: int | float) -> None:
+        '''Computes a stale value again in the background.
+        If it fails, the stale value is kept until it expires.'''
+
+        try:
+
+            self._compute(key, factory, expire, stale_while_revalidate)
+
+        except Exception:
+
+            pass
+
+    def _compute(self,
+                 key: str,
+                 factory: Callable[[], Any],
+                 expire: int | float,
+                 stale_while_revalidate: int | float) -> Any:
+        '''Computes the value of an item, adds it and hands it to the waiting threads.'''
+
+        with self._lock:
+
+            pending = self._pending[key]
+
+        try:
+
+            value = factory()
+
+        except Exception as e:
+
+            with self._lock:
+
+                self._pending.pop(key, None)
+
+            pending.set_exception(e)
+
+            raise
+
+        item = CacheItem(key, value, expire + stale_while_revalidate if expire else 0)
+
+        with self._lock:
+
+            self._add(item, True)
+
+            if expire and stale_while_revalidate:
+
+                item._fresh_until = time.monotonic() + expire
+
+            self._pending.pop(key, None)
+
+        pending.set_result(value)
+
+        return value
+
     def __getitem__(self,
                     key: str) -> Any:
         '''Gets an item from the cache.
         If the item does not exist, returns None.'''
-        
+
         return self.get(key)
-    
+
     def __iadd__(self,
                  item: 'CacheItem') -> Self:
         '''Adds an item to the cache.
         If the item already exists, it is overwritten.'''
-        
+
         self.add(item)
 
         return self
-    
+
     def __isub__(self,
                  key: str) -> Self:
         '''Removes an item from the cache.
         If the item does not exist, nothing happens.'''
-        
+
         self.remove(key)
 
         return self
@@ -90,6 +665,8 @@ class Cache:
 class CacheItem:
     '''Cache item class for storing items.'''
 
+    __slots__ = ('key', 'value', '_expire', '_deadline', '_size', '_fresh_until')
+
     def __init__(self,
                  key: str,
                  value: Any,
@@ -100,14 +677,11 @@ class CacheItem:
         self.key = key
         self.value = value
         self._expire = expire
+        self._deadline: float = None
+        self._size: int = 0
+        self._fresh_until: float = None
 
     def _set_expire(self) -> None:
-        '''Sets the expiration timer.'''
-
-        self._timer = threading.Timer(self._expire,
-                            self._parent.remove,
-                            args = (self.key,))
-        
-        self._timer.daemon = True
+        '''Sets the expiration deadline from now.'''
 
-        self._timer.start()
\ No newline at end of file
+        self._deadline = time.monotonic() + self._expire if self._expire else None
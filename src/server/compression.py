@@ -0,0 +1,170 @@
+import gzip
+import zlib
+from typing import Iterable
+
+from . import request
+from . import response
+
+try:
+
+    import brotli
+
+except ImportError:
+
+    brotli = None
+
+COMPRESSIBLE_TYPES: tuple[str, ...] = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'application/xhtml+xml',
+    'application/manifest+json',
+    'image/svg+xml',
+)
+
+ENCODINGS: tuple[str, ...] = ('br', 'gzip', 'deflate') if brotli else ('gzip', 'deflate')
+
+EXTENSIONS: dict[str, str] = {
+    'br': '.br',
+    'gzip': '.gz',
+}
+
+def compressible(content_type: str) -> bool:
+    '''Returns whether a content type is worth compressing.'''
+
+    return (content_type or '').split(';')[0].strip().lower().startswith(COMPRESSIBLE_TYPES)
+
+def negotiate(accept_encoding: str) -> str:
+    '''Returns the preferred encoding among those accepted by the client,
+    or None if the body should be sent as is.'''
+
+    if not accept_encoding:
+
+        return None
+
+    qualities = {}
+
+    for coding in accept_encoding.split(','):
+
+        name, _, parameters = coding.partition(';')
+
+        quality = 1.0
+
+        if (parameter:=parameters.strip()).startswith('q='):
+
+            try:
+
+                quality = float(parameter[2:])
+
+            except ValueError:
+
+                quality = 0.0
+
+        qualities[name.strip().lower()] = quality
+
+    encodings = [encoding for encoding in ENCODINGS
+                 if qualities.get(encoding, qualities.get('*', 0)) > 0]
+
+    if not encodings:
+
+        return None
+
+    return max(encodings, key = lambda encoding: qualities.get(encoding,
+                                                               qualities.get('*', 0)))
+
+def compress(data: bytes,
+             encoding: str) -> bytes:
+    '''Returns data compressed with an encoding.'''
+
+    if encoding == 'br':
+
+        return brotli.compress(data)
+
+    if encoding == 'gzip':
+
+        return gzip.compress(data, compresslevel = 6, mtime = 0)
+
+    return zlib.compress(data, 6)
+
+def add_vary(headers: dict[str, str],
+             names: Iterable[str] = ('Accept-Encoding',)) -> None:
+    '''Marks a response as varying on request headers, by default Accept-Encoding.
+    The names are merged with those already in the Vary header.'''
+
+    vary = [name.strip() for name in (headers.get('Vary') or '').split(',')
+            if name.strip()]
+
+    known = {name.lower() for name in vary}
+
+    for name in names:
+
+        if name.lower() not in known:
+
+            vary.append(name)
+
+            known.add(name.lower())
+
+    if vary:
+
+        headers['Vary'] = ', '.join(vary)
+
+def encode_headers(headers: dict[str, str],
+                   encoding: str,
+                   length: int) -> None:
+    '''Updates the headers of a response whose body was compressed.
+    The ETag is made weak as the compressed body is not the same bytes,
+    and ranges are no longer offered.'''
+
+    headers['Content-Encoding'] = encoding
+
+    headers['Content-Length'] = str(length)
+
+    headers.pop('Accept-Ranges', None)
+
+    if (etag:=headers.get('ETag')) and not etag.startswith('W/'):
+
+        headers['ETag'] = f'W/{etag}'
+
+def apply(message: response.Response,
+          request: request.Request,
+          *,
+          min_size: int = 1024) -> response.Response:
+    '''Compresses the body of a response with the encoding preferred by the client.
+    Only complete 200 responses of a compressible type and at least
+    min_size bytes which are not already encoded are compressed.'''
+
+    if message.code != 200 \
+       or message.is_streamed \
+       or 'Content-Encoding' in message.headers \
+       or not compressible(message.headers.get('Content-Type')):
+
+        return message
+
+    body = message.body.encode(encoding = 'utf-8',
+                               errors = 'ignore') if isinstance(message.body, str) \
+           else message.body
+
+    if len(body) < min_size:
+
+        return message
+
+    headers = dict(message.headers)
+
+    add_vary(headers)
+
+    if not (encoding:=negotiate(request.headers.get('Accept-Encoding'))):
+
+        message.headers = headers
+
+        return message
+
+    body = compress(body, encoding)
+
+    encode_headers(headers, encoding, len(body))
+
+    return response.Response(version = message.version,
+                             code = message.code,
+                             message = message.message,
+                             headers = headers,
+                             body = body)
@@ -0,0 +1,156 @@
+import collections.abc
+from typing import Iterable, Iterator
+
+class Headers(collections.abc.MutableMapping):
+    '''Case-insensitive multidict of HTTP headers.
+    Headers given as raw bytes are only decoded and split when first accessed.'''
+
+    __slots__ = ('_raw', '_items', '_index')
+
+    def __init__(self,
+                 headers: bytes | dict[str, str] | Iterable[tuple[str, str]] = None) \
+                 -> None:
+        '''Initializes the headers class.
+
+        :param headers: The raw header lines, a dictionary, or (name, value) pairs.'''
+
+        self._raw: bytes = None
+
+        self._items: list[tuple[str, str]] = None
+
+        self._index: dict[str, list[str]] = None
+
+        if isinstance(headers, (bytes, bytearray, memoryview)):
+
+            self._raw = headers
+
+        else:
+
+            self._items = []
+
+            self._index = {}
+
+            for name, value in (headers.items() if isinstance(headers, dict)
+                                else headers or ()):
+
+                self.add(name, value)
+
+    def _parse(self) -> None:
+        '''Decodes and splits the raw header lines.'''
+
+        self._items = []
+
+        self._index = {}
+
+        for line in bytes(self._raw).decode(encoding = 'utf-8',
+                                             errors = 'ignore').split('\r\n'):
+
+            name, colon, value = line.partition(':')
+
+            if colon:
+
+                self.add(name.strip(), value.strip())
+
+        self._raw = None
+
+    def add(self,
+            name: str,
+            value: str) -> None:
+        '''Adds a header, keeping the headers already set with the same name.'''
+
+        if self._items is None:
+
+            self._parse()
+
+        self._items.append((name, value))
+
+        self._index.setdefault(name.lower(), []).append(value)
+
+    def get_all(self,
+                name: str) -> list[str]:
+        '''Returns every value of a header, in the order they were received.'''
+
+        if self._items is None:
+
+            self._parse()
+
+        return list(self._index.get(name.lower(), ()))
+
+    def __getitem__(self,
+                    name: str) -> str:
+        '''Returns the first value of a header.'''
+
+        if self._items is None:
+
+            self._parse()
+
+        return self._index[name.lower()][0]
+
+    def __setitem__(self,
+                    name: str,
+                    value: str) -> None:
+        '''Sets a header, replacing every value it had.'''
+
+        if name.lower() in self:
+
+            del self[name]
+
+        self.add(name, value)
+
+    def __delitem__(self,
+                    name: str) -> None:
+        '''Removes every value of a header.'''
+
+        if self._items is None:
+
+            self._parse()
+
+        self._index.pop(name.lower())
+
+        self._items = [(key, value) for key, value in self._items
+                       if key.lower() != name.lower()]
+
+    def __contains__(self,
+                     name: object) -> bool:
+        '''Returns whether a header is set.'''
+
+        if self._items is None:
+
+            self._parse()
+
+        return isinstance(name, str) and name.lower() in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        '''Yields the name of every header once, as it was first received.'''
+
+        if self._items is None:
+
+            self._parse()
+
+        seen = set()
+
+        for name, _ in self._items:
+
+            if name.lower() not in seen:
+
+                seen.add(name.lower())
+
+                yield name
+
+    def __len__(self) -> int:
+        '''Returns the number of distinct headers.'''
+
+        if self._items is None:
+
+            self._parse()
+
+        return len(self._index)
+
+    def __repr__(self) -> str:
+        '''Returns representation of the headers as a string.'''
+
+        if self._items is None:
+
+            self._parse()
+
+        return f'<Headers({self._items})>'
@@ -0,0 +1,316 @@
+import re
+import shutil
+import tempfile
+from typing import Callable, Iterable
+
+_PARAMETER = re.compile(r';\s*([\w*-]+)=("(?:[^"\\]|\\.)*"|[^;]*)')
+
+class MultipartError(Exception):
+    '''Raised when a multipart/form-data body is malformed.'''
+
+    pass
+
+def _parameters(header: str) -> dict[str, str]:
+    '''Returns the parameters of a header value such as
+    'form-data; name="file"; filename="a.txt"' as a dictionary.'''
+
+    parameters = {}
+
+    for key, value in _PARAMETER.findall(header):
+
+        if value.startswith('"') and value.endswith('"'):
+
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+
+        parameters[key.lower()] = value.strip()
+
+    return parameters
+
+def boundary(content_type: str) -> str:
+    '''Returns the boundary of a multipart content type, or None.'''
+
+    if not content_type or not content_type.lower().startswith('multipart/'):
+
+        return None
+
+    return _parameters(content_type).get('boundary')
+
+class Part:
+    '''A part of a multipart/form-data body, either a form field or a file.'''
+
+    def __init__(self,
+                 headers: dict[str, str],
+                 *,
+                 spool_size: int = 1048576) -> None:
+        '''Initializes the part class.
+
+        :param headers: The headers of the part.
+        :param spool_size: The size in bytes after which the part is written to disk.'''
+
+        self.headers: dict[str, str] = headers
+
+        disposition = _parameters(';' + (headers.get('content-disposition') or '')
+                                  .split(';', 1)[-1])
+
+        self.name: str = disposition.get('name', '')
+
+        self.filename: str = disposition.get('filename')
+
+        self.content_type: str = headers.get('content-type') or \
+                                 ('application/octet-stream' if self.filename else 'text/plain')
+
+        self.size: int = 0
+
+        self.file: tempfile.SpooledTemporaryFile = \
+        tempfile.SpooledTemporaryFile(max_size = spool_size)
+
+    def read(self) -> bytes:
+        '''Returns the whole content of the part.'''
+
+        if self.file is None:
+
+            raise MultipartError(f'Part "{self.name}" was handed to a callback \
+and was not stored.')
+
+        self.file.seek(0)
+
+        return self.file.read()
+
+    def text(self,
+             encoding: str = 'utf-8') -> str:
+        '''Returns the content of the part decoded as text.'''
+
+        return self.read().decode(encoding = encoding,
+                                  errors = 'ignore')
+
+    def save(self,
+             path: str) -> None:
+        '''Writes the content of the part to a file.'''
+
+        if self.file is None:
+
+            raise MultipartError(f'Part "{self.name}" was handed to a callback \
+and was not stored.')
+
+        self.file.seek(0)
+
+        with open(path, 'wb') as destination:
+
+            shutil.copyfileobj(self.file, destination)
+
+    def __repr__(self) -> str:
+        '''Returns representation of the part as a string.'''
+
+        return f'<Part(name = {self.name}, \
+filename = {self.filename}, \
+size = {self.size})>'
+
+class MultipartParser:
+    '''Incrementally parses a multipart/form-data body fed to it in chunks.
+    Only the unparsed tail of the body is ever held in memory.'''
+
+    def __init__(self,
+                 boundary: str,
+                 *,
+                 spool_size: int = 1048576,
+                 on_data: Callable[[Part, bytes], None] = None,
+                 max_head_size: int = 16384) -> None:
+        '''Initializes the multipart parser class.
+
+        :param boundary: The boundary from the Content-Type header.
+        :param spool_size: The size in bytes after which a part is written to disk.
+        :param on_data: If given, it is called with each chunk of the file parts
+        instead of storing them. Form fields are always stored.
+        :param max_head_size: The maximum size of the headers of a part.'''
+
+        self._delimiter: bytes = b'\r\n--' + boundary.encode(encoding = 'utf-8')
+
+        self._spool_size: int = spool_size
+
+        self._on_data: Callable[[Part, bytes], None] = on_data
+
+        self._max_head_size: int = max_head_size
+
+        self._buffer: bytearray = bytearray(b'\r\n')
+
+        self._state: str = 'preamble'
+
+        self._part: Part = None
+
+        self.parts: list[Part] = []
+
+    @property
+    def done(self) -> bool:
+        '''Returns whether the closing boundary was reached.'''
+
+        return self._state == 'end'
+
+    def feed(self,
+             data: bytes) -> None:
+        '''Parses a chunk of the body.'''
+
+        if self._state == 'end':
+
+            return None
+
+        self._buffer += data
+
+        while self._step():
+
+            pass
+
+    def _step(self) -> bool:
+        '''Parses as much of the buffer as possible in the current state.
+        Returns whether more progress can be made without more data.'''
+
+        if self._state == 'preamble':
+
+            if (index:=self._buffer.find(self._delimiter)) == -1:
+
+                del self._buffer[:max(len(self._buffer) - len(self._delimiter), 0)]
+
+                return False
+
+            del self._buffer[:index + len(self._delimiter)]
+
+            self._state = 'delimiter'
+
+            return True
+
+        if self._state == 'delimiter':
+
+            if len(self._buffer) < 2:
+
+                return False
+
+            if self._buffer[:2] == b'--':
+
+                self._state = 'end'
+
+                self._buffer.clear()
+
+                return False
+
+            if (index:=self._buffer.find(b'\r\n')) == -1:
+
+                return False
+
+            del self._buffer[:index + 2]
+
+            self._state = 'headers'
+
+            return True
+
+        if self._state == 'headers':
+
+            if len(self._buffer) < 2:
+
+                return False
+
+            if self._buffer[:2] == b'\r\n':
+
+                index = -2
+
+            elif (index:=self._buffer.find(b'\r\n\r\n')) == -1:
+
+                if len(self._buffer) > self._max_head_size:
+
+                    raise MultipartError('Part headers are too large.')
+
+                return False
+
+            headers = {}
+
+            for line in self._buffer[:max(index, 0)].decode(encoding = 'utf-8',
+                                                            errors = 'ignore') \
+                        .split('\r\n'):
+
+                if ':' in line:
+
+                    key, value = line.split(':', 1)
+
+                    headers[key.strip().lower()] = value.strip()
+
+            del self._buffer[:index + 4]
+
+            self._part = Part(headers,
+                              spool_size = self._spool_size)
+
+            if self._on_data and self._part.filename is not None:
+
+                self._part.file = None
+
+            self.parts.append(self._part)
+
+            self._state = 'body'
+
+            return True
+
+        if self._state == 'body':
+
+            if (index:=self._buffer.find(self._delimiter)) == -1:
+
+                self._write(max(len(self._buffer) - len(self._delimiter) + 1, 0))
+
+                return False
+
+            self._write(index)
+
+            if self._part.file:
+
+                self._part.file.seek(0)
+
+            del self._buffer[:len(self._delimiter)]
+
+            self._state = 'delimiter'
+
+            return True
+
+        return False
+
+    def _write(self,
+               length: int) -> None:
+        '''Hands the first length bytes of the buffer to the current part.'''
+
+        if not length:
+
+            return None
+
+        with memoryview(self._buffer) as view:
+
+            if self._part.file is None:
+
+                self._on_data(self._part, bytes(view[:length]))
+
+            else:
+
+                self._part.file.write(view[:length])
+
+        self._part.size += length
+
+        del self._buffer[:length]
+
+def parse(chunks: Iterable[bytes],
+          boundary: str,
+          *,
+          spool_size: int = 1048576,
+          on_data: Callable[[Part, bytes], None] = None) -> list[Part]:
+    '''Parses a multipart/form-data body from an iterable of chunks.'''
+
+    parser = MultipartParser(boundary,
+                             spool_size = spool_size,
+                             on_data = on_data)
+
+    for chunk in chunks:
+
+        parser.feed(chunk)
+
+        if parser.done:
+
+            break
+
+    if not parser.done:
+
+        raise MultipartError('Body ended before the closing boundary.')
+
+    return parser.parts
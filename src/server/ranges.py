@@ -0,0 +1,216 @@
+import secrets
+from typing import Iterator
+
+from . import request
+from . import response
+from . import response_codes
+from . import response_messages
+
+MAX_RANGES = 16
+
+def parse(header: str,
+          size: int) -> list[tuple[int, int]]:
+    '''Parses a Range header into a list of (start, end) byte positions,
+    end excluded, for a body of the given size.
+    Returns None if the header is malformed, and an empty list if
+    none of the ranges can be satisfied.'''
+
+    unit, _, specs = header.partition('=')
+
+    if unit.strip().lower() != 'bytes' or not specs:
+
+        return None
+
+    ranges = []
+
+    for spec in specs.split(','):
+
+        first, dash, last = spec.strip().partition('-')
+
+        if not dash:
+
+            return None
+
+        try:
+
+            if not first:
+
+                start, end = max(size - int(last), 0), size
+
+            elif last:
+
+                if int(last) < int(first):
+
+                    return None
+
+                start, end = int(first), min(int(last) + 1, size)
+
+            else:
+
+                start, end = int(first), size
+
+        except ValueError:
+
+            return None
+
+        if start < 0:
+
+            return None
+
+        if start < size and start < end:
+
+            ranges.append((start, end))
+
+    return ranges
+
+def _validator_matches(if_range: str,
+                       message: response.Response) -> bool:
+    '''Returns whether an If-Range header matches the current version of a body.'''
+
+    if if_range.startswith('"'):
+
+        return if_range == message.headers.get('ETag')
+
+    return if_range == message.headers.get('Last-Modified')
+
+def _read_ranges(message: response.FileResponse,
+                 ranges: list[tuple[int, int]],
+                 boundary: str,
+                 content_type: str,
+                 size: int) -> Iterator[bytes]:
+    '''Yields a multipart/byteranges body, reading only the requested
+    windows of the file.'''
+
+    with open(message.filepath, 'rb') as file:
+
+        for start, end in ranges:
+
+            yield _part_head(boundary, content_type, start, end, size)
+
+            file.seek(message.offset + start)
+
+            remaining = end - start
+
+            while remaining and (chunk:=file.read(min(65536, remaining))):
+
+                remaining -= len(chunk)
+
+                yield chunk
+
+    yield f'\r\n--{boundary}--\r\n'.encode()
+
+def _part_head(boundary: str,
+               content_type: str,
+               start: int,
+               end: int,
+               size: int) -> bytes:
+    '''Returns the delimiter and headers of a part of a multipart/byteranges body.'''
+
+    return (f'\r\n--{boundary}\r\nContent-Type: {content_type}\r\n'
+            f'Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n').encode()
+
+def apply(message: response.Response,
+          request: request.Request) -> response.Response:
+    '''Answers a Range request with the requested part of a response.
+    Only full 200 responses with an "Accept-Ranges: bytes" header
+    and a file or bytes body are narrowed, others are returned unchanged.'''
+
+    if not (range_header:=request.headers.get('Range')) \
+       or message.code != 200 \
+       or message.headers.get('Accept-Ranges') != 'bytes' \
+       or request.method not in ('GET', 'HEAD'):
+
+        return message
+
+    if isinstance(message, response.FileResponse) and message.is_streamed:
+
+        size = message.length
+
+    elif isinstance(message.body, (bytes, bytearray)):
+
+        size = len(message.body)
+
+    else:
+
+        return message
+
+    if (if_range:=request.headers.get('If-Range')) \
+       and not _validator_matches(if_range.strip(), message):
+
+        return message
+
+    if (ranges:=parse(range_header, size)) is None or len(ranges) > MAX_RANGES:
+
+        return message
+
+    headers = dict(message.headers)
+
+    headers.pop('Content-Length', None)
+
+    if not ranges:
+
+        headers.pop('Content-Type', None)
+
+        headers['Content-Range'] = f'bytes */{size}'
+
+        headers['Content-Length'] = '0'
+
+        return response.Response(version = message.version,
+                                 code = response_codes.ResponseCodes.RANGE_NOT_SATISFIABLE,
+                                 message = response_messages.ResponseMessages\
+                                           .RANGE_NOT_SATISFIABLE,
+                                 headers = headers)
+
+    if len(ranges) == 1:
+
+        start, end = ranges[0]
+
+        headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+
+        if isinstance(message, response.FileResponse):
+
+            return response.FileResponse(version = message.version,
+                                         code = response_codes.ResponseCodes.PARTIAL_CONTENT,
+                                         message = response_messages.ResponseMessages\
+                                                   .PARTIAL_CONTENT,
+                                         headers = headers,
+                                         filepath = message.filepath,
+                                         offset = message.offset + start,
+                                         length = end - start)
+
+        headers['Content-Length'] = str(end - start)
+
+        return response.Response(version = message.version,
+                                 code = response_codes.ResponseCodes.PARTIAL_CONTENT,
+                                 message = response_messages.ResponseMessages\
+                                           .PARTIAL_CONTENT,
+                                 headers = headers,
+                                 body = message.body[start:end])
+
+    boundary = secrets.token_hex(16)
+
+    content_type = headers.get('Content-Type') or 'application/octet-stream'
+
+    headers['Content-Type'] = f'multipart/byteranges; boundary={boundary}'
+
+    headers['Content-Length'] = str(sum(len(_part_head(boundary, content_type,
+                                                       start, end, size)) + end - start
+                                        for start, end in ranges)
+                                    + len(f'\r\n--{boundary}--\r\n'))
+
+    if isinstance(message, response.FileResponse):
+
+        body = _read_ranges(message, ranges, boundary, content_type, size)
+
+    else:
+
+        body = b''.join(_part_head(boundary, content_type, start, end, size)
+                        + message.body[start:end]
+                        for start, end in ranges) \
+               + f'\r\n--{boundary}--\r\n'.encode()
+
+    return response.Response(version = message.version,
+                             code = response_codes.ResponseCodes.PARTIAL_CONTENT,
+                             message = response_messages.ResponseMessages.PARTIAL_CONTENT,
+                             headers = headers,
+                             body = body)
@@ -0,0 +1,187 @@
+import socket
+import io
+import tempfile
+
+class RequestReader:
+    '''Reads HTTP requests from a connection into a reusable buffer.
+    Bytes received past the end of a request are kept for the next one.'''
+
+    def __init__(self,
+                 connection: socket.socket,
+                 *,
+                 chunk_size: int = 65536,
+                 max_head_size: int = 65536) -> None:
+        '''Initializes the request reader class.
+
+        :param connection: The connection to read from.
+        :param chunk_size: The number of bytes to receive at once.
+        :param max_head_size: The maximum size of the request line and headers.'''
+
+        self._connection: socket.socket = connection
+
+        self._max_head_size: int = max_head_size
+
+        self._buffer: bytearray = bytearray()
+
+        self._chunk: bytearray = bytearray(chunk_size)
+
+    def _receive(self) -> int:
+        '''Receives a chunk from the connection into the buffer.
+        Returns the number of bytes received, 0 if the connection was closed.'''
+
+        received = self._connection.recv_into(self._chunk)
+
+        self._buffer += memoryview(self._chunk)[:received]
+
+        return received
+
+    def read_head(self) -> bytes:
+        '''Reads the request line and headers, including the blank line ending them.
+        Returns an empty bytes object if the connection was closed first.'''
+
+        searched = 0
+
+        while (end:=self._buffer.find(b'\r\n\r\n', searched)) == -1:
+
+            if len(self._buffer) > self._max_head_size:
+
+                raise ValueError('Request headers are too large.')
+
+            searched = max(len(self._buffer) - 3, 0)
+
+            if not self._receive():
+
+                return b''
+
+        head = bytes(self._buffer[:end + 4])
+
+        del self._buffer[:end + 4]
+
+        return head
+
+    def read_body(self,
+                  length: int) -> bytearray:
+        '''Reads exactly length bytes of body into a preallocated buffer.'''
+
+        body = bytearray(length)
+
+        view = memoryview(body)
+
+        filled = 0
+
+        while filled < length:
+
+            if not (received:=self.read_into(view[filled:])):
+
+                raise ConnectionError('Connection closed before the body was received.')
+
+            filled += received
+
+        return body
+
+    def read_into(self,
+                  view: memoryview) -> int:
+        '''Reads up to len(view) bytes into view, buffered bytes first.
+        Returns the number of bytes read, 0 if the connection was closed.'''
+
+        if self._buffer:
+
+            filled = min(len(view), len(self._buffer))
+
+            view[:filled] = self._buffer[:filled]
+
+            del self._buffer[:filled]
+
+            return filled
+
+        return self._connection.recv_into(view)
+
+    def body(self,
+             length: int) -> 'RequestBody':
+        '''Returns a stream reading the next length bytes on demand.'''
+
+        return RequestBody(self,
+                           length = length)
+
+class RequestBody(io.RawIOBase):
+    '''File-like object streaming a request body from the connection.
+    Nothing is received until the body is read.'''
+
+    def __init__(self,
+                 reader: RequestReader,
+                 *,
+                 length: int) -> None:
+        '''Initializes the request body class.
+
+        :param reader: The reader of the connection the body is sent on.
+        :param length: The length of the body in bytes.'''
+
+        super().__init__()
+
+        self._reader: RequestReader = reader
+
+        self._remaining: int = length
+
+    @property
+    def remaining(self) -> int:
+        '''Returns the number of bytes of the body not read yet.'''
+
+        return self._remaining
+
+    def readable(self) -> bool:
+        '''Returns True, request bodies are always readable.'''
+
+        return True
+
+    def readinto(self,
+                 buffer: bytearray | memoryview) -> int:
+        '''Reads up to len(buffer) bytes of the body into buffer.
+        Returns the number of bytes read, 0 once the body is exhausted.'''
+
+        if not self._remaining:
+
+            return 0
+
+        view = memoryview(buffer).cast('B')[:self._remaining]
+
+        if not (received:=self._reader.read_into(view)):
+
+            raise ConnectionError('Connection closed before the body was received.')
+
+        self._remaining -= received
+
+        return received
+
+    def readall(self) -> bytearray:
+        '''Reads the rest of the body into a preallocated buffer.'''
+
+        body = self._reader.read_body(self._remaining)
+
+        self._remaining = 0
+
+        return body
+
+    def __iter__(self):
+        '''Yields the rest of the body in chunks as it is received.'''
+
+        while chunk:=self.read(65536):
+
+            yield chunk
+
+    def spool(self,
+              max_size: int = 1048576) -> tempfile.SpooledTemporaryFile:
+        '''Reads the rest of the body into a temporary file, which is kept
+        in memory until it grows larger than max_size bytes.
+        The returned file is positioned at its start.'''
+
+        spooled = tempfile.SpooledTemporaryFile(max_size = max_size)
+
+        buffer = bytearray(65536)
+
+        while received:=self.readinto(buffer):
+
+            spooled.write(memoryview(buffer)[:received])
+
+        spooled.seek(0)
+
+        return spooled
@@ -1,5 +1,8 @@
+import io
 import mimetypes
 import pathlib
+import os
+from typing import Iterable
 
 from . import response_codes
 from . import response
@@ -40,14 +43,70 @@ def text(text: str,
                              headers = headers,
                              body = text)
 
+def stream(body: Iterable[str | bytes],
+           *,
+           filetype: str = 'txt',
+           content_length: int = None,
+           code: int | response_codes.ResponseCodes = 200,
+           message: str | response_messages.ResponseMessages = 'OK',
+           headers: dict = None) -> response.Response:
+    '''Returns a response sent as it is produced. Use this to return generators,
+    iterators, async generators or file objects without building them in memory.
+    The body is sent with chunked transfer encoding unless its length is known.
+    The length of files opened in text mode is never known, as their newlines
+    are translated and their characters encoded as they are read.'''
+
+    if not headers:
+
+        headers = {}
+
+    if type(code) == response_codes.ResponseCodes:
+
+        code = code.value
+
+    if type(message) == response_messages.ResponseMessages:
+
+        message = message.value
+
+    if content_length is None and hasattr(body, 'fileno') \
+       and not isinstance(body, io.TextIOBase):
+
+        try:
+
+            content_length = os.fstat(body.fileno()).st_size - body.tell()
+
+        except (OSError, ValueError):
+
+            pass
+
+    if content_length is None:
+
+        headers['Transfer-Encoding'] = 'chunked'
+
+    else:
+
+        headers['Content-Length'] = str(content_length)
+
+    headers['Content-Type'] = mimetypes.guess_type(f'file.{filetype.strip(".")}')[0]\
+                              or 'text/plain'
+
+    return response.Response(version = 1.1,
+                             code = code,
+                             message = message,
+                             headers = headers,
+                             body = body)
+
 def file(filepath: str,
          *,
          code: int | response_codes.ResponseCodes = 200,
          message: str | response_messages.ResponseMessages = 'OK',
          headers: dict = None,
          is_template: bool = False,
+         stream_template: bool = False,
          **templated_values) -> response.Response:
-    '''Returns a file as a response. Use this to return HTML, CSS, JS, images, etc.'''
+    '''Returns a file as a response. Use this to return HTML, CSS, JS, images, etc.
+    With stream_template, a template is sent with chunked encoding as it is rendered
+    instead of being rendered in full first.'''
 
     if not headers:
 
@@ -64,30 +123,32 @@ def file(filepath: str,
     if not filepath or not pathlib.Path(filepath).exists():
 
         raise FileNotFoundError(f'File not found: {filepath}')
-            
-    else:
-
-        with open(filepath, 'rb') as file:
 
-            data = file.read()
+    headers['Content-Type'] = mimetypes.guess_type(filepath)[0]\
+                              or 'application/octet-stream'
 
-    if is_template:
+    if not is_template:
 
-        if not templated_values:
+        return response.FileResponse(version = 1.1,
+                                     code = code,
+                                     message = message,
+                                     headers = headers,
+                                     filepath = filepath)
 
-            templated_values = {}
+    if stream_template:
 
-        if isinstance(data, bytes):
+        return stream(template.load(filepath).stream(**templated_values),
+                      filetype = pathlib.Path(filepath).suffix or 'txt',
+                      code = code,
+                      message = message,
+                      headers = headers)
 
-            data = data.decode(encoding = 'utf-8',
-                               errors = 'ignore')
+    data = template.load(filepath).render(**templated_values)
 
-        data = template._template(data = data,
-                                  **templated_values)
+    data = data.encode(encoding = 'utf-8',
+                       errors = 'ignore')
 
     headers['Content-Length'] = str(len(data))
-    headers['Content-Type'] = mimetypes.guess_type(filepath)[0]\
-                              or 'application/octet-stream'
 
     return response.Response(version = 1.1,
                              code = code,
@@ -130,18 +191,13 @@ def attachment(filepath: str = '',
 
         raise FileNotFoundError(f'File not found: {filepath}')
 
-    with open(filepath, 'rb') as f:
-
-        data = f.read()
-
-    headers['Content-Length'] = str(len(data))
     headers['Content-Type'] = mimetypes.guess_type(filepath)[0]\
                               or 'application/octet-stream'
     headers['Content-Disposition'] = ('attachment' if is_download else 'inline')\
                                      + (f'; filename="{filename}"' if filename else '')
 
-    return response.Response(version = 1.1,
-                             code = response_codes.ResponseCodes.OK,
-                             message = response_messages.ResponseMessages.OK,
-                             headers = headers,
-                             body = data)
\ No newline at end of file
+    return response.FileResponse(version = 1.1,
+                                 code = response_codes.ResponseCodes.OK,
+                                 message = response_messages.ResponseMessages.OK,
+                                 headers = headers,
+                                 filepath = filepath)
\ No newline at end of file
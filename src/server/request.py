@@ -1,9 +1,23 @@
 from typing import Self
-import urllib
+import urllib.parse
 import json
+import io
+import tempfile
+from typing import Callable
+
+from . import reader
+from . import multipart
+from . import headers as request_headers
 
 class Request:
-    '''Represents an HTTP request.'''
+    '''Represents an HTTP request.
+    The query, cookies, form and JSON body are only parsed when first accessed,
+    then kept for later calls.'''
+
+    __slots__ = ('address', 'method', 'path', 'version', 'headers',
+                 '_body', '_stream', '_spooled', '_parts',
+                 '_raw_query', '_query', '_cookies', '_form', '_json',
+                 '__dict__')
 
     def __init__(self,
                  *,
@@ -11,10 +25,14 @@ class Request:
                  method: str = '',
                  path: str = '',
                  version: float = '',
-                 headers: dict = {},
-                 body: str = '',
-                 query: dict = {}) -> None:
-        '''Initializes the request class.'''
+                 headers: dict | request_headers.Headers = None,
+                 body: bytes = b'',
+                 query: dict = None,
+                 stream: reader.RequestBody = None,
+                 raw_query: str = '') -> None:
+        '''Initializes the request class.
+        If a stream is given, the body is read from it when first accessed.
+        If no query is given, it is parsed from raw_query when first accessed.'''
 
         self.address: tuple[str, int] = address
 
@@ -24,62 +42,140 @@ class Request:
 
         self.version: float = version
 
-        self.headers: dict[str, str] = headers
+        self.headers: request_headers.Headers = \
+        headers if isinstance(headers, request_headers.Headers) \
+        else request_headers.Headers(headers)
 
-        self.body: bytes = body
+        self._body: bytes = body if stream is None else None
 
-        self.query: dict[str, str] = query
+        self._stream: reader.RequestBody = stream
 
-    @classmethod
-    def from_bytestring(cls,
-                         *,
-                         address: tuple = (),
-                         request: bytes) -> Self:
-        '''Creates a request object from an HTTP request string.'''
+        self._spooled: tempfile.SpooledTemporaryFile = None
+
+        self._parts: list[multipart.Part] = None
+
+        self._raw_query: str = raw_query
+
+        self._query: dict[str, str] = query
+
+        self._cookies: dict[str, str] = None
+
+        self._form: dict[str, list[str]] = None
+
+        self._json: dict | list = None
+
+    @property
+    def query(self) -> dict[str, str]:
+        '''Returns the query of the request, parsing it on first access.'''
+
+        if self._query is None:
+
+            self._query = {key: value[0] for key, value in
+                           urllib.parse.parse_qs(self._raw_query).items()}
+
+        return self._query
+
+    @query.setter
+    def query(self,
+              query: dict[str, str]) -> None:
+        '''Sets the query of the request.'''
+
+        self._query = query
+
+    @property
+    def body(self) -> bytes:
+        '''Returns the request body, reading it from the connection if needed.
+        Only the unread part is returned if the stream was partially read.'''
+
+        if self._body is None:
+
+            if self._spooled:
+
+                self._spooled.seek(0)
+
+                self._body = self._spooled.read()
+
+            else:
+
+                self._body = self._stream.read()
+
+        return self._body
+
+    @body.setter
+    def body(self,
+             body: bytes) -> None:
+        '''Sets the request body, dropping the form and JSON parsed from the old one.'''
+
+        self._body = body
+
+        self._form = None
 
-        lines = request.split(b'\r\n')
+        self._json = None
 
-        method, path, version = lines[0].decode(encoding = 'utf-8',
-                                                errors = 'ignore').split(' ')
+    def stream(self) -> io.RawIOBase:
+        '''Returns the request body as a file-like object.
+        When the body has not been read yet, it is received from the connection
+        as it is read, so large uploads never have to fit in memory.
+        With AsyncServer, it was already received into a temporary file.'''
 
-        if '?' in path:
+        if self._body is None and not self._spooled:
 
-            path, query = path.split('?')
+            return self._stream
 
-        else:
+        if self._spooled:
 
-            query = ''
+            self._spooled.seek(0)
 
-        path = urllib.parse.unquote(path).rstrip('/')
+            return self._spooled
 
-        query = urllib.parse.parse_qs(query)
+        return io.BytesIO(self._body)
 
-        for key, value in query.items():
+    def spool(self,
+              max_size: int = 1048576) -> tempfile.SpooledTemporaryFile:
+        '''Returns the request body as a seekable temporary file,
+        which spills to disk once it is larger than max_size bytes.'''
 
-            query[key] = value[0]
+        if not self._spooled:
 
-        headers = {}
+            if self._body is None:
 
-        for line in lines[1:]:
+                self._spooled = self._stream.spool(max_size = max_size)
 
-            if line == b'':
+            else:
 
-                break
+                self._spooled = tempfile.SpooledTemporaryFile(max_size = max_size)
 
-            key, value = line.decode(encoding = 'utf-8',
-                                     errors = 'ignore').split(': ')
+                self._spooled.write(self._body)
 
-            headers[key] = value
+        self._spooled.seek(0)
 
-        body = b'\r\n'.join(lines[lines.index(b'') + 1:])
+        return self._spooled
+
+    @classmethod
+    def from_bytestring(cls,
+                         *,
+                         address: tuple = (),
+                         request: bytes) -> Self:
+        '''Creates a request object from an HTTP request string.
+        Only the request line is decoded, the headers are kept as raw bytes
+        until they are first accessed.'''
+
+        head, _, body = request.partition(b'\r\n\r\n')
+
+        request_line, _, raw_headers = head.partition(b'\r\n')
+
+        method, target, version = request_line.decode(encoding = 'utf-8',
+                                                      errors = 'ignore').split(' ')
+
+        path, _, query = target.partition('?')
 
         return cls(address = address,
                    method = method,
-                   path = path,
+                   path = urllib.parse.unquote(path).rstrip('/'),
                    version = float(version.split('/')[1]),
-                   headers = headers,
+                   headers = request_headers.Headers(raw_headers),
                    body = body,
-                   query = query)
+                   raw_query = query)
     
     def __str__(self) -> str:
         '''Returns the request as an HTTP request string.'''
@@ -90,80 +186,90 @@ class Request:
 self.body.decode(encoding = 'utf-8',
                  errors = 'ignore')
 
-    def cookies(self) -> dict[str, list[str]]:
-        '''Returns the request cookies as a dictionary.'''
+    def cookies(self) -> dict[str, str]:
+        '''Returns the request cookies as a dictionary, parsed as in RFC 6265.
+        Pairs without a name or an equal sign are skipped,
+        and only the first value of a repeated cookie is kept.'''
 
-        try:
+        if self._cookies is None:
 
             cookies = {}
 
-            raw_cookies = self.headers.get('Cookie') or self.headers.get('cookie')
+            for cookie in (self.headers.get('Cookie') or '').split(';'):
 
-            for cookie in raw_cookies.split(';'):
+                name, equals, value = cookie.partition('=')
 
-                key, value = list(urllib.parse.parse_qs(cookie.strip()).items())[0]
+                if not equals or not (name:=name.strip()) or name in cookies:
 
-                cookies[key] = value[0]
+                    continue
 
-            return cookies
-        
-        except Exception:
+                value = value.strip()
 
-            return {}
+                if len(value) > 1 and value[0] == value[-1] == '"':
+
+                    value = value[1:-1]
+
+                cookies[name] = value
+
+            self._cookies = cookies
+
+        return self._cookies
 
     def json(self) -> dict | list:
         '''Returns the request body as a JSON object.'''
 
-        return json.loads(self.body.decode(encoding = 'utf-8',
-                                           errors = 'ignore'))
+        if self._json is None:
+
+            self._json = json.loads(self.body.decode(encoding = 'utf-8',
+                                                     errors = 'ignore'))
+
+        return self._json
     
     def form(self) -> dict[str, list[str]]:
         '''Returns the request body as parsed urlencoded form data.'''
 
-        return urllib.parse.parse_qs(self.body.decode(encoding = 'utf-8',
-                                                      errors = 'ignore'))
-    
-    def files(self) -> dict[str, bytes]:
+        if self._form is None:
 
-        try:
+            self._form = urllib.parse.parse_qs(self.body.decode(encoding = 'utf-8',
+                                                                errors = 'ignore'))
 
-            content_type = self.headers.get('Content-Type') or\
-            self.headers.get('content-type')
-        
-            boundry = content_type.split('; ')[1].split('=')[1]
+        return self._form
+    
+    def multipart(self,
+                  *,
+                  spool_size: int = 1048576,
+                  on_data: Callable[[multipart.Part, bytes], None] = None) \
+                  -> list[multipart.Part]:
+        '''Parses the request body as multipart/form-data while it is received.
+        Returns every part, form fields included, in the order they were sent.
 
-            parts = self.body.split(b'--' + boundry.encode(encoding = 'utf-8',
-                                    errors = 'ignore') + b'\r\n')[1:]
-            
-            parts[-1] = parts[-1].split(b'--' + boundry.encode(encoding = 'utf-8',
-                                    errors = 'ignore') + b'--\r\n')[0]
+        :param spool_size: The size in bytes after which a part is written to disk.
+        :param on_data: If given, it is called with each chunk of the file parts
+        instead of storing them.'''
 
-        except Exception:
+        if self._parts is None:
 
-            return {}
-        
-        files = {}
-        
-        for part in parts:
+            if not (boundary:=multipart.boundary(self.headers.get('Content-Type'))):
 
-            try:
+                raise multipart.MultipartError('Request body is not multipart.')
 
-                full_header, body = part.split(b'\r\n\r\n', 1)
+            stream = self.stream()
 
-                full_header = full_header.decode(encoding = 'utf-8',
-                                                 errors = 'ignore').split('\r\n')
+            self._parts = multipart.parse(iter(lambda: stream.read(65536), b''),
+                                          boundary,
+                                          spool_size = spool_size,
+                                          on_data = on_data)
 
-                headers = {name: value for name, value in 
-                           [header.split(': ') for header in full_header]}
-                
-                if filename:=(
-                   (headers.get('Content-Disposition') or \
-                    headers.get('content-disposition')).split('=')[-1].strip('"')):
+        return self._parts
 
-                    files[filename] = body
+    def files(self) -> dict[str, bytes]:
+        '''Returns the files of a multipart/form-data body by filename.'''
 
-            except Exception:
+        try:
 
-                continue
+            return {part.filename: part.read() for part in self.multipart()
+                    if part.filename}
 
-        return files
\ No newline at end of file
+        except Exception:
+
+            return {}
@@ -1,6 +1,41 @@
+import asyncio
+import collections.abc
+import copy
+import os
+import concurrent.futures
+from typing import AsyncIterator, Iterable, Iterator
+
 from . import response_codes
 from . import response_messages
 
+def _iter_async(body: collections.abc.AsyncIterable) -> Iterator[str | bytes]:
+    '''Yields the items of an async iterable from a private event loop,
+    so it can be sent from a thread which has no event loop.'''
+
+    loop = asyncio.new_event_loop()
+
+    iterator = aiter(body)
+
+    try:
+
+        while True:
+
+            try:
+
+                yield loop.run_until_complete(anext(iterator))
+
+            except StopAsyncIteration:
+
+                return None
+
+    finally:
+
+        if hasattr(iterator, 'aclose'):
+
+            loop.run_until_complete(iterator.aclose())
+
+        loop.close()
+
 class Response:
     '''Represents an HTTP response.'''
 
@@ -9,17 +44,19 @@ class Response:
                  code: int | response_codes.ResponseCodes,
                  message: str | response_messages.ResponseMessages,
                  headers: dict,
-                 body: str | bytes = ''):
-        '''Initializes the response class.'''
+                 body: str | bytes | Iterable[str | bytes] = ''):
+        '''Initializes the response class.
+        The body can also be an iterable, an async iterable or a file object,
+        in which case it is sent as it is produced.'''
 
         self.version: float = version
 
         if isinstance(code, response_codes.ResponseCodes):
-            
+
             code = code.value
 
         if isinstance(message, response_messages.ResponseMessages):
-            
+
             message = message.value
 
         self.code: int | response_codes.ResponseCodes = code
@@ -28,31 +65,318 @@ class Response:
 
         self.headers: dict = headers
 
-        self.body: str | bytes = body
+        self.body: str | bytes | Iterable[str | bytes] = body
+
+    @property
+    def is_streamed(self) -> bool:
+        '''Returns whether the body is sent as it is produced.'''
+
+        return not isinstance(self.body, (str, bytes, bytearray))
+
+    @property
+    def chunked(self) -> bool:
+        '''Returns whether the body is sent with chunked transfer encoding.'''
+
+        return (self.headers.get('Transfer-Encoding') or \
+                self.headers.get('transfer-encoding')) == 'chunked'
+
+    def _without_body(self) -> 'Response':
+        '''Returns a copy of the response without its body, to answer a HEAD request.
+        The response itself is left as is, as a route may return it again.'''
+
+        if self.is_streamed and hasattr(self.body, 'close'):
+
+            self.body.close()
+
+        message = copy.copy(self)
+
+        message.body = b''
+
+        return message
+
+    def _head(self) -> bytes:
+        '''Returns the status line and headers as bytes.'''
+
+        return (f'HTTP/{self.version} {self.code} {self.message}\r\n'\
++ '\r\n'.join([f'{key}: {value}' for key, value in self.headers.items()]) + '\r\n\r\n')\
+.encode(encoding = 'utf-8',
+        errors = 'ignore')
+
+    def _encode(self,
+                chunk: str | bytes) -> bytes:
+        '''Encodes a chunk of a streamed body as it is sent.'''
+
+        if isinstance(chunk, str):
+
+            chunk = chunk.encode(encoding = 'utf-8',
+                                 errors = 'ignore')
+
+        if self.chunked and chunk:
+
+            return f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n'
+
+        return chunk
+
+    def _iter_bytes(self) -> Iterator[bytes]:
+        '''Yields the response as the bytes to send on the connection.
+        Async iterable bodies are driven by a private event loop.'''
+
+        if not self.is_streamed:
+
+            yield self._head() + (self.body if isinstance(self.body, (bytes, bytearray))
+                                  else self.body.encode(encoding = 'utf-8',
+                                                        errors = 'ignore'))
+
+            return None
+
+        yield self._head()
+
+        if hasattr(self.body, 'read'):
+
+            chunks = iter(lambda: self.body.read(65536) or None, None)
+
+        elif isinstance(self.body, collections.abc.AsyncIterable):
+
+            chunks = _iter_async(self.body)
+
+        else:
+
+            chunks = self.body
+
+        try:
+
+            for chunk in chunks:
+
+                if data:=self._encode(chunk):
+
+                    yield data
+
+        finally:
+
+            if hasattr(self.body, 'close'):
+
+                self.body.close()
+
+        if self.chunked:
+
+            yield b'0\r\n\r\n'
+
+    async def _aiter_bytes(self,
+                           executor: concurrent.futures.Executor = None) \
+                           -> AsyncIterator[bytes]:
+        '''Yields the response as the bytes to send on the connection
+        from within an event loop. Synchronous bodies are produced in the executor.'''
+
+        if not isinstance(self.body, collections.abc.AsyncIterable):
+
+            if not self.is_streamed:
+
+                for data in self._iter_bytes():
+
+                    yield data
+
+                return
+
+            loop = asyncio.get_running_loop()
+
+            iterator = self._iter_bytes()
+
+            while (data:=await loop.run_in_executor(executor,
+                                                     next,
+                                                     iterator,
+                                                     None)) is not None:
+
+                yield data
+
+            return
+
+        yield self._head()
+
+        async for chunk in self.body:
+
+            if data:=self._encode(chunk):
+
+                yield data
+
+        if self.chunked:
+
+            yield b'0\r\n\r\n'
 
     def __str__(self):
         '''Returns the response as a string.
-        This is not a valid HTTP response as the body is not encoded.'''
+        This is not a valid HTTP response as the body is not encoded.
+        Streamed bodies are left out so they are not consumed.'''
 
         return f'HTTP/{self.version} {self.code} {self.message}\r\n' \
 + '\r\n'.join([f'{key}: {value}' for key, value in self.headers.items()]) \
 + '\r\n\r\n' \
-+ (self.body if isinstance(self.body, str) else self.body.decode(encoding = 'utf-8',
++ ('' if self.is_streamed else
+   self.body if isinstance(self.body, str) else self.body.decode(encoding = 'utf-8',
                                                                 errors = 'ignore'))
 
     def __bytes__(self):
-        '''Returns the response as a bytes object. This is a valid HTTP response.'''
+        '''Returns the response as a bytes object. This is a valid HTTP response.
+        Streamed bodies are consumed.'''
+
+        return b''.join(self._iter_bytes())
 
-        return (f'HTTP/{self.version} {self.code} {self.message}\r\n'\
-+ '\r\n'.join([f'{key}: {value}' for key, value in self.headers.items()]) + '\r\n\r\n')\
-.encode(encoding = 'utf-8',
-        errors = 'ignore')\
-+ (self.body if isinstance(self.body, bytes) else self.body.encode(encoding = 'utf-8',
-                                                                  errors = 'ignore'))
-    
     def __repr__(self):
         '''Returns representation of the response as a string.'''
 
         return f'<Response(version = {self.version}, \
 code = {self.code}, \
-message = {self.message})>'
\ No newline at end of file
+message = {self.message})>'
+
+class FileResponse(Response):
+    '''Represents an HTTP response whose body is a region of a file.
+    The file is only opened when the response is sent, with socket.sendfile
+    when possible, so its content never has to be held in memory.'''
+
+    def __init__(self,
+                 version: float,
+                 code: int | response_codes.ResponseCodes,
+                 message: str | response_messages.ResponseMessages,
+                 headers: dict,
+                 filepath: str,
+                 *,
+                 offset: int = 0,
+                 length: int = None):
+        '''Initializes the file response class.
+
+        :param filepath: The path of the file to send.
+        :param offset: The position in the file the body starts at.
+        :param length: The length of the body. Defaults to the rest of the file.'''
+
+        super().__init__(version = version,
+                         code = code,
+                         message = message,
+                         headers = headers,
+                         body = None)
+
+        self.filepath: str = filepath
+
+        self.offset: int = offset
+
+        self.length: int = length if length is not None \
+                           else os.path.getsize(filepath) - offset
+
+        self.headers['Content-Length'] = str(self.length)
+
+        self.headers.setdefault('Accept-Ranges', 'bytes')
+
+    @property
+    def body(self) -> bytes:
+        '''Returns the body, reading it from the file unless it was replaced.'''
+
+        if self._body is not None:
+
+            return self._body
+
+        with open(self.filepath, 'rb') as file:
+
+            file.seek(self.offset)
+
+            return file.read(self.length)
+
+    @body.setter
+    def body(self,
+             body: str | bytes) -> None:
+        '''Replaces the body read from the file.'''
+
+        self._body = body
+
+    def _without_body(self) -> 'FileResponse':
+        '''Returns a copy of the response without its body, to answer a HEAD request.
+        The response itself is left as is, as a route may return it again.'''
+
+        message = copy.copy(self)
+
+        message.body = b''
+
+        return message
+
+    @property
+    def is_streamed(self) -> bool:
+        '''Returns whether the body is still read from the file when it is sent.'''
+
+        return self._body is None
+
+    def _iter_bytes(self) -> Iterator[bytes]:
+        '''Yields the response as the bytes to send on the connection,
+        reading the file in chunks. Raises an OSError if the file ends early,
+        so the connection is closed rather than left waiting for the rest.'''
+
+        if not self.is_streamed:
+
+            yield from super()._iter_bytes()
+
+            return None
+
+        yield self._head()
+
+        with open(self.filepath, 'rb') as file:
+
+            file.seek(self.offset)
+
+            remaining = self.length
+
+            while remaining and (chunk:=file.read(min(65536, remaining))):
+
+                remaining -= len(chunk)
+
+                yield chunk
+
+        if remaining:
+
+            raise OSError(f'File "{self.filepath}" shrank while it was sent.')
+
+    async def _aiter_bytes(self,
+                           executor: concurrent.futures.Executor = None) \
+                           -> AsyncIterator[bytes]:
+        '''Yields the response as the bytes to send on the connection
+        from within an event loop, reading the file in the executor.'''
+
+        loop = asyncio.get_running_loop()
+
+        iterator = self._iter_bytes()
+
+        while (data:=await loop.run_in_executor(executor,
+                                                 next,
+                                                 iterator,
+                                                 None)) is not None:
+
+            yield data
+
+class CachedResponse(Response):
+    '''Represents an HTTP response serialized once to be sent again as is.'''
+
+    def __init__(self,
+                 message: Response):
+        '''Initializes the cached response class.
+
+        :param message: The response to serialize. Its body must not be streamed.'''
+
+        super().__init__(version = message.version,
+                         code = message.code,
+                         message = message.message,
+                         headers = message.headers,
+                         body = message.body)
+
+        self._raw: bytes = b''.join(message._iter_bytes())
+
+    def _without_body(self) -> 'CachedResponse':
+        '''Returns a copy of the response without its body, to answer a HEAD request.
+        The response itself is left as is, as it is sent again from the cache.'''
+
+        message = copy.copy(self)
+
+        message._raw = self._head()
+
+        message.body = b''
+
+        return message
+
+    def _iter_bytes(self) -> Iterator[bytes]:
+        '''Yields the serialized response.'''
+
+        yield self._raw
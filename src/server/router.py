@@ -0,0 +1,207 @@
+from typing import Any
+
+from . import render
+from . import response
+from . import response_codes
+from . import response_messages
+
+CONVERTERS: dict[str, callable] = {
+    'str': str,
+    'int': int,
+    'float': float,
+}
+
+class _RouteNode:
+    '''A segment of the route tree.'''
+
+    __slots__ = ('children', 'wildcards', 'route')
+
+    def __init__(self) -> None:
+        '''Initializes the route node class.'''
+
+        self.children: dict[str, _RouteNode] = {}
+
+        self.wildcards: list[tuple[str, callable, _RouteNode]] = []
+
+        self.route: str = None
+
+class RouteTree:
+    '''Segment tree of routes compiled when they are added,
+    so matching a path only walks its segments once.
+    Wildcard segments are written %name% or %name:type% with type
+    being one of str, int or float. Fixed segments take precedence.'''
+
+    def __init__(self) -> None:
+        '''Initializes the route tree class.'''
+
+        self._root: _RouteNode = _RouteNode()
+
+    def add(self,
+            route: str) -> None:
+        '''Adds a route to the tree.'''
+
+        node = self._root
+
+        for segment in route.split('/'):
+
+            if len(segment) > 1 and segment.startswith('%') and segment.endswith('%'):
+
+                kind = segment[1:-1].partition(':')[2] or 'str'
+
+                if (converter:=CONVERTERS.get(kind)) is None:
+
+                    raise ValueError(f'Unknown wildcard type "{kind}" in route "{route}".')
+
+                for wildcard_kind, _, child in node.wildcards:
+
+                    if wildcard_kind == kind:
+
+                        node = child
+
+                        break
+
+                else:
+
+                    child = _RouteNode()
+
+                    node.wildcards.append((kind, converter, child))
+
+                    node = child
+
+            else:
+
+                node = node.children.setdefault(segment, _RouteNode())
+
+        node.route = route
+
+    def match(self,
+              path: str) -> tuple[str, list[Any]]:
+        '''Returns the route matching a path and its converted wildcard values,
+        or None and an empty list.'''
+
+        return self._match(self._root, path.split('/'), 0, [])
+
+    def _match(self,
+               node: _RouteNode,
+               segments: list[str],
+               index: int,
+               values: list[Any]) -> tuple[str, list[Any]]:
+        '''Matches the segments from index onwards below node.'''
+
+        if index == len(segments):
+
+            return (node.route, values) if node.route is not None else (None, [])
+
+        segment = segments[index]
+
+        if (child:=node.children.get(segment)):
+
+            if (found:=self._match(child, segments, index + 1, values))[0] is not None:
+
+                return found
+
+        for _, converter, child in node.wildcards:
+
+            try:
+
+                value = converter(segment)
+
+            except ValueError:
+
+                continue
+
+            if (found:=self._match(child, segments, index + 1, values + [value]))[0] \
+               is not None:
+
+                return found
+
+        return None, []
+
+class RoutePlan:
+    '''Dispatch plan of a route, computed when its handlers are registered:
+    the handler of each method, whether it takes a session, how long its responses
+    are cached and the request headers they vary on, and the responses
+    to disallowed methods and OPTIONS requests.'''
+
+    __slots__ = ('handlers', 'default', 'allow', 'not_allowed', 'options')
+
+    def __init__(self) -> None:
+        '''Initializes the route plan class.'''
+
+        self.handlers: dict[str, tuple[callable, bool, float, tuple[str, ...]]] = {}
+
+        self.default: tuple[callable, bool, float, tuple[str, ...]] = None
+
+        self.allow: str = ''
+
+        self.not_allowed: callable = None
+
+        self.options: callable = None
+
+    def add(self,
+            function: callable,
+            *,
+            methods: list[str] = None,
+            include_session: bool = False,
+            cache_ttl: float = 0,
+            vary: list[str] = None) -> None:
+        '''Adds the handler of some methods, or of every method if methods is None.'''
+
+        handler = (function, include_session, cache_ttl, tuple(vary or ()))
+
+        if methods is None:
+
+            self.default = handler
+
+        else:
+
+            for method in methods:
+
+                self.handlers[method.upper()] = handler
+
+        allowed = set(self.handlers)
+
+        if 'GET' in allowed:
+
+            allowed.add('HEAD')
+
+        allowed.add('OPTIONS')
+
+        self.allow = ', '.join(sorted(allowed))
+
+        headers = {'Allow': self.allow}
+
+        self.not_allowed = lambda *_: render.text('405 Method Not Allowed',
+                           code = response_codes.ResponseCodes.METHOD_NOT_ALLOWED,
+                           message = response_messages.ResponseMessages.METHOD_NOT_ALLOWED,
+                           headers = dict(headers))
+
+        self.options = lambda *_: response.Response(version = 1.1,
+                       code = response_codes.ResponseCodes.NO_CONTENT,
+                       message = response_messages.ResponseMessages.NO_CONTENT,
+                       headers = dict(headers))
+
+    def resolve(self,
+                method: str) -> tuple[callable, bool, float, tuple[str, ...]]:
+        '''Returns the handler of a method, whether it takes a session,
+        the time its responses are cached and the headers they vary on.
+        HEAD falls back to the GET handler and OPTIONS is answered automatically.
+        Disallowed methods get a 405 handler.'''
+
+        if (handler:=self.handlers.get(method)):
+
+            return handler
+
+        if method == 'HEAD' and (handler:=self.handlers.get('GET')):
+
+            return handler
+
+        if self.default:
+
+            return self.default
+
+        if method == 'OPTIONS':
+
+            return self.options, False, 0, ()
+
+        return self.not_allowed, False, 0, ()
@@ -1,11 +1,23 @@
 import logging
+import os
 import pathlib
+import inspect
+import asyncio
+import functools
+import concurrent.futures
+import collections.abc
+from typing import Any
 
 from . import response_messages
 from . import response_codes
 from . import response
 from . import request
 from . import render
+from . import sessions
+from . import ranges
+from . import router
+from . import cache
+from . import compression
 
 class Routes:
     '''Stores, sorts, and handles a collection of routes.'''
@@ -16,11 +28,11 @@ class Routes:
 
         self._root_uses_session = False
 
-        self._session_routes: list = []
+        self._route_tree: router.RouteTree = router.RouteTree()
 
-        self._routes: dict[str: callable] = {
+        self._routes: dict[str, router.RoutePlan] = {}
 
-            self._404route: lambda request: render.text('''<!DOCTYPE html>
+        self._add_route(self._404route, lambda request: render.text('''<!DOCTYPE html>
 
 <html>
 
@@ -41,9 +53,9 @@ class Routes:
 </html>''',
 filetype='html',
 code = response_codes.ResponseCodes.NOT_FOUND,
-message = response_messages.ResponseMessages.NOT_FOUND),
+message = response_messages.ResponseMessages.NOT_FOUND))
 
-            self._500route: lambda request: render.text('''<!DOCTYPE html>
+        self._add_route(self._500route, lambda request: render.text('''<!DOCTYPE html>
 
 <html>
 
@@ -64,20 +76,55 @@ message = response_messages.ResponseMessages.NOT_FOUND),
 </html>''',
 filetype='html',
 code = response_codes.ResponseCodes.INTERNAL_SERVER_ERROR,
-message = response_messages.ResponseMessages.INTERNAL_SERVER_ERROR)
+message = response_messages.ResponseMessages.INTERNAL_SERVER_ERROR))
 
-    }
+    def _add_route(self,
+                   path: str,
+                   function: callable,
+                   *,
+                   methods: list[str] = None,
+                   include_session: bool = False,
+                   cache_ttl: float = 0,
+                   vary: list[str] = None) -> None:
+        '''Registers a handler and compiles it into the route's dispatch plan.'''
+
+        if path not in self._routes:
+
+            self._routes[path] = router.RoutePlan()
+
+            self._route_tree.add(path)
+
+        self._routes[path].add(function,
+                               methods = methods,
+                               include_session = include_session,
+                               cache_ttl = cache_ttl,
+                               vary = vary)
 
     def route(self,
               path: str,
               *,
+              methods: list[str] = None,
               include_session: bool = False,
-              static_ressources: dict[str: str] = None) -> callable:
+              static_ressources: dict[str: str] = None,
+              cache_ttl: float = 0,
+              vary: list[str] = None) -> callable:
         '''Adds a route to the server.
         
         :param path: The path to the route. Ex: '/home', '/about', '/contact'.
+        Wildcard segments are written '%name%', or '%name:int%' and '%name:float%'
+        to receive converted values. Ex: '/users/%id:int%'.
+        :param methods: The HTTP methods the route handles. Other methods are
+        answered with a 405, HEAD and OPTIONS are handled automatically.
+        If None, the route handles every method.
         :param include_session: Whether or not to include the session as a parameter.
-        :param static_ressources: A dictionary of static ressources'''
+        :param static_ressources: A dictionary of static ressources, served like
+        the files of the static directory and revalidated when they change.
+        :param cache_ttl: The time in seconds the responses to GET and HEAD requests
+        are cached and sent again without calling the route. 0 disables caching.
+        Routes including the session are never cached, nor is any route
+        when the root function includes the session.
+        :param vary: The request headers whose values get separate cached responses.
+        Ex: ['Accept-Encoding'].'''
 
         if static_ressources is None:
 
@@ -89,18 +136,18 @@ message = response_messages.ResponseMessages.INTERNAL_SERVER_ERROR)
 
             if pathlib.Path(ressource_file_path).exists():
 
-                ressource = render.file(filepath = ressource_file_path)
-
-                self._routes[ressource_reference_path] = \
-                lambda _, ressource = ressource: ressource
-
-        if include_session:
-
-            self._session_routes.append(path.rstrip('/'))
+                self._add_route(ressource_reference_path,
+                                lambda request, ressource_file_path = ressource_file_path:
+                                self._static_cache.response(ressource_file_path, request))
 
         def callable_route(route_function):
 
-            self._routes[path.rstrip('/')] = route_function
+            self._add_route(path.rstrip('/'),
+                            route_function,
+                            methods = methods,
+                            include_session = include_session,
+                            cache_ttl = cache_ttl,
+                            vary = vary)
 
             return route_function
         
@@ -121,216 +168,338 @@ message = response_messages.ResponseMessages.INTERNAL_SERVER_ERROR)
         return callable_root
     
     def _get_wildcard_path(self,
-                           path: str,
-                           *,
-                           request: request.Request) -> bytes:
-        '''Gets a route with wildcard values.'''
-    
-        for route in self._routes:
+                           path: str) -> tuple[str, list[Any]]:
+        '''Gets a route with wildcard values.
+        Returns the route and the wildcard values, or None and an empty list.'''
+
+        return self._route_tree.match(path)
+
+    def _get_static_path(self,
+                         path: str) -> str:
+        '''Gets the file a path in the static directory refers to.
+        Returns None if the path leads outside of the static directory,
+        once its ".." segments are collapsed.'''
+
+        static_dir = os.path.normpath(self._static_dir)
+
+        filepath = os.path.normpath(path.strip('/'))
+
+        if not filepath.startswith(static_dir + os.sep):
+
+            return None
+
+        return filepath
+
+    def _get_session(self,
+                     request: request.Request) -> sessions.LazySession:
+        '''Gets the session of a request, which is only looked up when it is first used
+        and only created when it is first changed.'''
+
+        return sessions.LazySession(self.sessions,
+                                    request.cookies().get('SESSION_ID'))
 
-            if not len(route.split('/')) == len(path.split('/')):
+    def _prepare_route(self,
+                       path: str,
+                       *,
+                       request: request.Request) \
+                       -> tuple[tuple, tuple, sessions.LazySession, tuple]:
+        '''Resolves a path to the calls needed to answer it.
+        Returns the root call (or None), the route call, the session (or None)
+        and the key and time to cache the response with (or None).
+        Each call is a tuple of a function and the arguments following the request.'''
 
-                continue
+        if path in self._routes:
 
-            for sub_route, sub_path in zip(route.split('/'), path.split('/')):
+            route, wildcard_values = path, []
 
-                if (not sub_route == sub_path) \
-                    and (not (sub_route.startswith('%') \
-                            and sub_route.endswith('%'))):
+        elif pathlib.Path(path).is_relative_to(
+             pathlib.Path('/' + self._static_dir.as_posix().strip('/'))):
 
-                    break
+            if (filepath:=self._get_static_path(path)) is None:
+
+                route, wildcard_values = self._404route, []
 
             else:
 
-                wildcard_values = []
+                return None, (lambda request: self._static_cache.response(filepath,
+                                                                          request),
+                              ()), None, None
 
-                for sub_route, sub_path \
-                    in zip(route.split('/'), path.split('/')):
+        else:
 
-                    if sub_route.startswith('%') and sub_route.endswith('%'):
+            route, wildcard_values = self._get_wildcard_path(path = path)
 
-                        wildcard_values.append(sub_path)
+            if route is None:
 
-                if route in self._session_routes:
+                route, wildcard_values = self._404route, []
 
-                    try:
+        function, include_session, cache_ttl, vary = \
+        self._routes[route].resolve(request.method)
 
-                        if (self.sessions.exists(
-                        session_id:=request.cookies().get('SESSION_ID'))):
+        cache_entry = None
 
-                            session = self.sessions.get(session_id)
+        if cache_ttl and not include_session and request.method in ('GET', 'HEAD') \
+           and not (self._root and self._root_uses_session) \
+           and 'Range' not in request.headers:
 
-                        else:
+            cache_entry = ((request.method, path, request._raw_query,
+                            compression.negotiate(request.headers.get('Accept-Encoding')),
+                            *(request.headers.get(header) for header in vary)),
+                           cache_ttl,
+                           vary)
 
-                            session = self.sessions.get(self.sessions.add())
+        session = None
 
-                    except Exception:
+        if include_session or (self._root and self._root_uses_session):
 
-                        session = self.sessions.get(self.sessions.add())
+            session = self._get_session(request = request)
 
-                    if self._root:
+        if include_session:
+
+            route_call = (function, (session, *wildcard_values))
 
-                        if self._root_uses_session:
+        else:
 
-                            self._root(request, session)
+            route_call = (function, tuple(wildcard_values))
 
-                        else:
-                        
-                            self._root(request)
+        root_call = None
 
-                    message = self._routes[route](request,
-                                                 session,
-                                                 *wildcard_values)
-                    
-                    if isinstance(message, str):
+        if self._root:
 
-                        message = render.text(text = message)
+            if self._root_uses_session:
 
-                    if cookies:=(message.headers.get('Set-Cookie') or \
-                                 message.headers.get('set-cookie')):
+                root_call = (self._root, (session,))
 
-                        cookies += f', SESSION_ID={session.id}; \
-Expires={session.expires}'
+            else:
+
+                root_call = (self._root, ())
+
+        return root_call, route_call, session, cache_entry
+
+    def _cache_response(self,
+                        message: response.Response,
+                        cache_entry: tuple) -> response.Response:
+        '''Stores a finalized response to be sent again for the same request.
+        Only complete 200 responses which do not set cookies are stored.'''
+
+        if message.code != 200 or message.is_streamed or 'Set-Cookie' in message.headers:
+
+            return message
+
+        key, cache_ttl, vary = cache_entry
+
+        if vary:
+
+            compression.add_vary(message.headers, vary)
 
-                        message.headers['Set-Cookie'] = cookies
+        message = response.CachedResponse(message)
 
-                    else:
+        self._response_cache.add(cache.CacheItem(key, message, cache_ttl))
 
-                        message.headers['Set-Cookie'] = f'SESSION_ID={session.id}; \
+        return message
+
+    def _finalize_route(self,
+                        message: str | response.Response,
+                        *,
+                        request: request.Request,
+                        session: sessions.LazySession = None) -> response.Response:
+        '''Turns the value returned by a route into a response.'''
+
+        if isinstance(message, str):
+
+            message = render.text(text = message)
+
+        elif isinstance(message, (collections.abc.Iterator,
+                                  collections.abc.AsyncIterator)):
+
+            message = render.stream(message)
+
+        if not isinstance(message, response.Response):
+
+            raise TypeError(f'Expected function for {request.path} \
+to return str, iterator, file, or Response, got {type(message)}.')
+
+        if session and session._session:
+
+            self.sessions.save(session._session)
+
+        if session and session._changed():
+
+            if cookies:=(message.headers.get('Set-Cookie') or \
+                         message.headers.get('set-cookie')):
+
+                cookies += f', SESSION_ID={session.id}; Expires={session.expires}'
+
+                message.headers['Set-Cookie'] = cookies
+
+            else:
+
+                message.headers['Set-Cookie'] = f'SESSION_ID={session.id}; \
 Expires={session.expires}'
 
-                else:
+        message = ranges.apply(message,
+                               request = request)
+
+        if self._compression_min_size is not None:
+
+            message = compression.apply(message,
+                                        request = request,
+                                        min_size = self._compression_min_size)
 
-                    if self._root:
+        if request.method == 'HEAD':
 
-                        if self._root_uses_session:
+            message = message._without_body()
 
-                            self._root(request, self.sessions.get(self.sessions.add()))
+        return message
 
-                        else:
-                        
-                            self._root(request)
+    def _finalize_blocks(self,
+                         message: str | response.Response,
+                         session: sessions.LazySession = None) -> bool:
+        '''Returns whether finalizing the value returned by a route may take long,
+        as it saves a session, which may write to disk, or compresses the body.'''
 
-                    message = self._routes[route](request,
-                                                 *wildcard_values)
+        if session and session._session:
 
-                    if isinstance(message, str):
+            return True
 
-                        message = render.text(text = message)
+        if self._compression_min_size is None:
 
-                if isinstance(message, response.Response):
+            return False
 
-                    return bytes(message)
-                
-                else:
+        if isinstance(message, response.Response):
 
-                    raise TypeError(f'Expected function for {request.path} \
-to return str, or Response, got {type(message)}.')
+            if message.is_streamed:
 
-        return self._get_route(self._404route, request = request)
+                return False
+
+            message = message.body
+
+        return isinstance(message, (str, bytes, bytearray)) \
+               and len(message) >= self._compression_min_size
 
     def _get_route(self,
                   path: str,
                   *,
-                  request: request.Request = request.Request()) -> bytes:
-        '''Gets a route from the _routes dictionary.'''
+                  request: request.Request = request.Request()) -> response.Response:
+        '''Gets the response to a request for a path.'''
 
-        if path in self._routes:
+        root_call, route_call, session, cache_entry = \
+        self._prepare_route(path = path,
+                            request = request)
 
-            if path in self._session_routes:
+        try:
 
-                try:
+            if root_call:
 
-                    if (self.sessions.exists(
-                        session_id:=request.cookies().get('SESSION_ID'))):
+                root_function, root_args = root_call
 
-                        session = self.sessions.get(session_id)
+                if inspect.isawaitable(result:=root_function(request, *root_args)):
 
-                    else:
+                    asyncio.run(result)
 
-                        session = self.sessions.get(self.sessions.add())
+            if cache_entry and (cached:=self._response_cache.get(cache_entry[0])):
 
-                except Exception:
+                return cached
 
-                    session = self.sessions.get(self.sessions.add())
+            route_function, route_args = route_call
 
-                if self._root:
+            if inspect.isawaitable(message:=route_function(request, *route_args)):
 
-                    if self._root_uses_session:
+                message = asyncio.run(message)
 
-                        self._root(request, session)
+        except Exception as e:
 
-                    else:
-                    
-                        self._root(request)
+            if path == self._500route:
 
-                try:
+                raise
 
-                    message = self._routes[path](request,
-                                                session)
-                    
-                except Exception as e:
+            self._logger.exception(e)
 
-                    self._logger.exception(e)
+            return self._get_route(self._500route, request = request)
 
-                    message = self._routes[self._500route](request, session)
-                
-                if isinstance(message, str):
+        message = self._finalize_route(message,
+                                       request = request,
+                                       session = session)
 
-                    message = render.text(text = message)
+        if cache_entry:
 
-                if cookies:=message.headers.get('Set-Cookie'):
+            message = self._cache_response(message, cache_entry)
 
-                    cookies += f', SESSION_ID={session.id}; Expires={session.expires}'
+        return message
 
-                    message.headers['Set-Cookie'] = cookies
+    async def _get_route_async(self,
+                               path: str,
+                               *,
+                               request: request.Request = request.Request(),
+                               executor: concurrent.futures.Executor = None) \
+                               -> response.Response:
+        '''Gets the response to a request for a path from within an event loop.
+        Coroutine functions are awaited, other functions run in the executor,
+        as does finalizing responses which save a session or are compressed.'''
 
-                else:
+        root_call, route_call, session, cache_entry = \
+        self._prepare_route(path = path,
+                            request = request)
 
-                    message.headers['Set-Cookie'] = f'SESSION_ID={session.id}; \
-Expires={session.expires}'
+        loop = asyncio.get_running_loop()
 
-            else:
-   
-                if self._root:
+        async def call(function: callable, args: tuple) -> Any:
 
-                    if self._root_uses_session:
+            if inspect.iscoroutinefunction(function):
 
-                        self._root(request, self.sessions.get(self.sessions.add()))
+                return await function(request, *args)
 
-                    else:
-                    
-                        self._root(request)
+            result = await loop.run_in_executor(executor,
+                                                functools.partial(function,
+                                                                  request,
+                                                                  *args))
 
-                try:
+            if inspect.isawaitable(result):
 
-                    message = self._routes[path](request)
-                    
-                except Exception as e:
+                result = await result
 
-                    self._logger.exception(e)
+            return result
 
-                    message = self._routes[self._500route](request)
+        try:
 
-                if isinstance(message, str):
+            if root_call:
 
-                    message = render.text(text = message)
-            
-            if isinstance(message, response.Response):
+                await call(*root_call)
 
-                return bytes(message)
-            
-            else:
+            if cache_entry and (cached:=self._response_cache.get(cache_entry[0])):
 
-                raise TypeError(f'Expected function for {request.path} \
-to return str, or Response, got {type(message)}.')
-            
-        elif pathlib.Path(path).is_relative_to(
-             pathlib.Path('/' + self._static_dir.as_posix().strip('/'))):
+                return cached
+
+            message = await call(*route_call)
 
-            return bytes(render.file(filepath = path.strip('/')))
+        except Exception as e:
+
+            if path == self._500route:
+
+                raise
+
+            self._logger.exception(e)
+
+            return await self._get_route_async(self._500route,
+                                               request = request,
+                                               executor = executor)
+
+        if self._finalize_blocks(message, session):
+
+            message = await loop.run_in_executor(executor,
+                                                 functools.partial(self._finalize_route,
+                                                                   message,
+                                                                   request = request,
+                                                                   session = session))
 
         else:
 
-            return self._get_wildcard_path(path = path,
-                                          request = request)
\ No newline at end of file
+            message = self._finalize_route(message,
+                                           request = request,
+                                           session = session)
+
+        if cache_entry:
+
+            message = self._cache_response(message, cache_entry)
+
+        return message
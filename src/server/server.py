@@ -1,13 +1,25 @@
 import threading
 import socket
 import logging
+import queue
 from typing import Self
 import ssl
 import pathlib
+import os
+import signal
+import time
+import secrets
 
 from . import request
+from . import reader as request_reader
 from . import routes
 from . import sessions
+from . import static
+from . import cache
+from . import render
+from . import response
+from . import response_codes
+from . import response_messages
 
 class Server(routes.Routes):
     '''HTTP server running on a specified host and port.'''
@@ -21,7 +33,22 @@ class Server(routes.Routes):
                  _500route: str = '/500',
                  static_dir: str = 'static/',
                  ssl_context: ssl.SSLContext = None,
-                 sessions_expire_after: float = 900) -> None:
+                 sessions_expire_after: float = 900,
+                 sessions_sliding_expiration: bool = False,
+                 session_backend: sessions.SessionBackend = None,
+                 session_mode: str = 'server',
+                 session_secret: bytes = None,
+                 max_workers: int = None,
+                 backlog: int = None,
+                 queue_size: int = None,
+                 on_overload: str = 'wait',
+                 keep_alive_timeout: float = None,
+                 shutdown_timeout: float = 10,
+                 max_body_size: int = None,
+                 static_cache_size: int = 33554432,
+                 static_cache_control: str = 'public, max-age=0, must-revalidate',
+                 response_cache_size: int = 33554432,
+                 compression_min_size: int = 1024) -> None:
         '''Initializes the server class.
         
         :param host: The IP address to run the server on.
@@ -30,7 +57,37 @@ class Server(routes.Routes):
         :param _404route: The route to use for 404 errors.
         :param _500route: The route to use for 500 errors.
         :param static_dir: The directory to use for static files.
-        :param ssl_context: The SSL context to use for HTTPS.'''
+        :param ssl_context: The SSL context to use for HTTPS.
+        :param sessions_expire_after: The time in seconds after which a session expires.
+        :param sessions_sliding_expiration: Whether the expiry of a session is reset
+        every time it is used.
+        :param session_backend: Where the sessions are kept. Defaults to the memory
+        of the process, use a SQLiteSessionBackend to share them between workers.
+        :param session_mode: Where sessions are stored, "server" keeps them in the
+        session backend and "signed-cookie" in a signed cookie sent to the client.
+        :param session_secret: The key signed cookies are signed with.
+        If None, a random key is made and sessions are lost when the server restarts.
+        :param max_workers: The number of worker threads handling connections.
+        If None, a new thread is spawned for every connection.
+        :param backlog: The number of unaccepted connections the OS will queue.
+        :param queue_size: The number of accepted connections waiting for a worker.
+        Defaults to max_workers.
+        :param on_overload: What to do when the queue is full, "wait" blocks
+        accepting new connections and "reject" answers them with a 503.
+        :param keep_alive_timeout: The time in seconds an idle connection is kept open.
+        If None, connections are kept open until the client closes them, except with
+        max_workers where they are closed after 5 seconds, as an idle connection
+        holds a worker thread until it is closed.
+        :param shutdown_timeout: The time in seconds worker processes are given
+        to finish their open connections when stopping.
+        :param max_body_size: The largest request body in bytes that is accepted,
+        larger requests are answered with a 413. If None, there is no limit.
+        :param static_cache_size: The memory budget in bytes of the static file cache.
+        :param static_cache_control: The Cache-Control header sent with static files.
+        :param response_cache_size: The memory budget in bytes of the responses
+        cached for routes with a cache_ttl.
+        :param compression_min_size: The smallest response body in bytes which is
+        compressed when the client accepts it. If None, responses are never compressed.'''
         
         
         self._host: str = host
@@ -65,21 +122,126 @@ class Server(routes.Routes):
 
         self._ssl_context: ssl.SSLContext = ssl_context
 
-        self.sessions: sessions.Sessions = \
-        sessions.Sessions(remove_after = sessions_expire_after)
+        self._static_cache: static.StaticCache = \
+        static.StaticCache(max_bytes = static_cache_size,
+                           cache_control = static_cache_control,
+                           compression_min_size = compression_min_size)
+
+        self._compression_min_size: int = compression_min_size
+
+        self._response_cache: cache.Cache = \
+        cache.Cache('responses',
+                    max_bytes = response_cache_size,
+                    sizeof = lambda key, value: 256 + len(value._raw))
+
+        if session_mode not in ('server', 'signed-cookie'):
+
+            raise ValueError(f'Expected session_mode to be "server" or "signed-cookie", \
+got "{session_mode}".')
+
+        if session_mode == 'signed-cookie':
+
+            self.sessions: sessions.SignedCookieSessions = \
+            sessions.SignedCookieSessions(secret = session_secret or secrets.token_bytes(32),
+                                          remove_after = sessions_expire_after,
+                                          sliding_expiration = sessions_sliding_expiration)
+
+        else:
+
+            self.sessions: sessions.Sessions = \
+            sessions.Sessions(remove_after = sessions_expire_after,
+                              sliding_expiration = sessions_sliding_expiration,
+                              backend = session_backend)
+
+        if on_overload not in ('wait', 'reject'):
+
+            raise ValueError(f'Expected on_overload to be "wait" or "reject", \
+got "{on_overload}".')
+
+        self._max_workers: int = max_workers
+
+        self._backlog: int = backlog
+
+        self._queue_size: int = queue_size if queue_size is not None else max_workers
+
+        self._on_overload: str = on_overload
+
+        self._keep_alive_timeout: float = keep_alive_timeout
+
+        self._pooled_keep_alive_timeout: float = keep_alive_timeout \
+                                                 if keep_alive_timeout is not None else 5
+
+        self._connections: queue.Queue = None
+
+        self._workers: list[threading.Thread] = []
+
+        self._shutdown_timeout: float = shutdown_timeout
+
+        self._reuse_port: bool = False
+
+        self._open_connections: int = 0
+
+        self._open_connections_lock: threading.Lock = threading.Lock()
+
+        self._worker_pids: dict[int, float] = None
+
+        self._max_body_size: int = max_body_size
+
+        self._too_large_response: bytes = bytes(render.text('413 Payload Too Large',
+                        code = response_codes.ResponseCodes.PAYLOAD_TOO_LARGE,
+                        message = response_messages.ResponseMessages.PAYLOAD_TOO_LARGE,
+                        headers = {'Connection': 'close'}))
+
+        self._bad_request_response: bytes = bytes(render.text('400 Bad Request',
+                        code = response_codes.ResponseCodes.BAD_REQUEST,
+                        message = response_messages.ResponseMessages.BAD_REQUEST,
+                        headers = {'Connection': 'close'}))
+
+        self._stopping: threading.Event = threading.Event()
+
+        self._supervisor: threading.Thread = None
+
+        self._overloaded_response: bytes = bytes(render.text('503 Service Unavailable',
+                        code = response_codes.ResponseCodes.SERVICE_UNAVAILABLE,
+                        message = response_messages.ResponseMessages.SERVICE_UNAVAILABLE,
+                        headers = {'Connection': 'close',
+                                   'Retry-After': '1'}))
 
 
         super().__init__()
 
-    def start(self) -> None:
-        '''Starts the server.'''
+    def start(self,
+              workers: int = None) -> None:
+        '''Starts the server.
+
+        :param workers: The number of processes to fork, each listening on the
+        same host and port with SO_REUSEPORT. Dead workers are restarted.
+        If None, the server runs in the current process.'''
 
         if self._logger:
 
             self._logger.info('Starting server...')
-        
-        threading.Thread(target = self._listen,
-                        daemon = True).start()
+
+        if not workers:
+
+            self._start_listening()
+
+            return None
+
+        if not hasattr(os, 'fork') or not hasattr(socket, 'SO_REUSEPORT'):
+
+            raise RuntimeError('Multiple workers require os.fork and SO_REUSEPORT, \
+which are not available on this platform.')
+
+        self._worker_pids = {}
+
+        self._stopping.clear()
+
+        self._supervisor = threading.Thread(target = self._supervise,
+                                            args = (workers,),
+                                            daemon = True)
+
+        self._supervisor.start()
         
     def wait(self,
              msg: str = '') -> None:
@@ -100,20 +262,153 @@ class Server(routes.Routes):
 
             self._logger.info('Stopping server...')
 
-        self._socket.close()
+        if self._worker_pids is None:
+
+            self._stop_listening()
+
+        else:
+
+            self._stopping.set()
+
+            self._supervisor.join()
+
+        self.sessions.flush()
 
         if self._logger:
 
             self._logger.info('Server stopped.')
 
+    def _start_listening(self) -> None:
+        '''Starts listening for connections in the current process.'''
+
+        threading.Thread(target = self._listen,
+                        daemon = True).start()
+
+    def _stop_listening(self) -> None:
+        '''Stops listening for connections in the current process.'''
+
+        try:
+
+            self._socket.shutdown(socket.SHUT_RDWR)
+
+        except OSError:
+
+            pass
+
+        self._socket.close()
+
+    def _supervise(self,
+                   workers: int) -> None:
+        '''Forks the worker processes, restarts the ones that die,
+        and terminates all of them once the server is stopping.'''
+
+        for _ in range(workers):
+
+            self._fork_worker()
+
+        while not self._stopping.wait(0.5):
+
+            for pid, started in list(self._worker_pids.items()):
+
+                if os.waitpid(pid, os.WNOHANG) == (0, 0):
+
+                    continue
+
+                self._worker_pids.pop(pid)
+
+                if self._logger:
+
+                    self._logger.warning(f'Worker {pid} died, restarting it.')
+
+                if time.monotonic() - started < 1:
+
+                    time.sleep(1)
+
+                self._fork_worker()
+
+        for pid in self._worker_pids:
+
+            try:
+
+                os.kill(pid, signal.SIGTERM)
+
+            except ProcessLookupError:
+
+                pass
+
+        deadline = time.monotonic() + self._shutdown_timeout + 1
+
+        for pid in self._worker_pids:
+
+            while os.waitpid(pid, os.WNOHANG) == (0, 0):
+
+                if time.monotonic() > deadline:
+
+                    os.kill(pid, signal.SIGKILL)
+
+                    os.waitpid(pid, 0)
+
+                    break
+
+                time.sleep(0.05)
+
+        self._worker_pids = None
+
+    def _fork_worker(self) -> None:
+        '''Forks a worker process running the server.'''
+
+        if pid:=os.fork():
+
+            self._worker_pids[pid] = time.monotonic()
+
+            return None
+
+        try:
+
+            self._run_worker()
+
+        finally:
+
+            os._exit(0)
+
+    def _run_worker(self) -> None:
+        '''Serves connections inside a forked worker process until SIGTERM,
+        then waits for the open connections to close.'''
+
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+
+        self._worker_pids = None
+
+        self._reuse_port = True
+
+        self._start_listening()
+
+        signal.sigwait({signal.SIGTERM})
+
+        self._stop_listening()
+
+        deadline = time.monotonic() + self._shutdown_timeout
+
+        while self._open_connections and time.monotonic() < deadline:
+
+            time.sleep(0.05)
+
+        self.sessions.flush()
+
     def _listen(self) -> None:
         '''Listens for incoming connections 
-        and spawns a thread to handle each request.'''
+        and hands each one to a worker, or spawns a thread to handle it.'''
 
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
         self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
+        if self._reuse_port:
+
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
         if self._ssl_context:
 
             self._socket = self._ssl_context.wrap_socket(self._socket,
@@ -121,7 +416,26 @@ class Server(routes.Routes):
 
         self._socket.bind((self._host, self._port))
 
-        self._socket.listen()
+        if self._backlog is None:
+
+            self._socket.listen()
+
+        else:
+
+            self._socket.listen(self._backlog)
+
+        if self._max_workers:
+
+            self._connections = queue.Queue(maxsize = self._queue_size)
+
+            for _ in range(self._max_workers):
+
+                worker = threading.Thread(target = self._work,
+                                          daemon = True)
+
+                worker.start()
+
+                self._workers.append(worker)
 
         if self._logger:
 
@@ -134,33 +448,111 @@ class Server(routes.Routes):
 
                 connection, address = self._socket.accept()
 
-                threading.Thread(target = self._handle_request,
-                                kwargs = {'connection': connection,
-                                        'address': address},
-                                daemon = True).start()
+                if self._max_workers:
+
+                    connection.settimeout(self._pooled_keep_alive_timeout)
+
+                elif self._keep_alive_timeout is not None:
+
+                    connection.settimeout(self._keep_alive_timeout)
+
+                if not self._max_workers:
+
+                    threading.Thread(target = self._serve_connection,
+                                    kwargs = {'connection': connection,
+                                            'address': address},
+                                    daemon = True).start()
+
+                elif self._on_overload == 'reject':
+
+                    try:
+
+                        self._connections.put_nowait((connection, address))
+
+                    except queue.Full:
+
+                        self._reject(connection = connection,
+                                     address = address)
+
+                else:
+
+                    self._connections.put((connection, address))
 
             except OSError:
 
                 break
+
+        for _ in self._workers:
+
+            self._connections.put(None)
+
+        self._workers = []
+
+    def _work(self) -> None:
+        '''Handles queued connections until a stop sentinel is received.'''
+
+        while (item:=self._connections.get()) is not None:
+
+            self._serve_connection(*item)
+
+    def _serve_connection(self,
+                          connection: socket.socket,
+                          address: socket.AddressInfo) -> None:
+        '''Handles a connection while keeping count of the open connections.'''
+
+        with self._open_connections_lock:
+
+            self._open_connections += 1
+
+        try:
+
+            self._handle_request(connection = connection,
+                                 address = address)
+
+        finally:
+
+            with self._open_connections_lock:
+
+                self._open_connections -= 1
+
+    def _reject(self,
+                connection: socket.socket,
+                address: socket.AddressInfo) -> None:
+        '''Answers a connection with a 503 when every worker is busy.'''
+
+        if self._logger:
+
+            self._logger.warning(f'Server overloaded, rejecting connection from \
+{address[0]}:{address[1]}.')
+
+        try:
+
+            connection.sendall(self._overloaded_response)
+
+            connection.close()
+
+        except Exception:
+
+            pass
                 
     def _handle_request(self,
                         connection: socket.socket,
                         address: socket.AddressInfo) -> None:
-        '''Handles a request from a client.'''
+        '''Handles a request from a client.
+        If an error occurs once the response started being sent, the connection
+        is only closed, as a 500 can no longer be sent in its place.'''
 
-        while True:
-            
-            try:
+        parsed_request = request.Request()
 
-                raw_request = b''
+        reader = request_reader.RequestReader(connection)
 
-                while True:
-
-                    raw_request += connection.recv(4096)
+        while True:
 
-                    if b'\r\n\r\n' in raw_request or raw_request == b'':
+            response_started = False
+            
+            try:
 
-                        break
+                raw_request = reader.read_head()
 
                 if not raw_request:
                         
@@ -189,35 +581,70 @@ class Server(routes.Routes):
 
                     return None
 
-                if content_length:=(parsed_request.headers.get('Content-Length') or \
-                                    parsed_request.headers.get('content-length')):
+                if content_length:=parsed_request.headers.get('Content-Length'):
+
+                    if not (content_length:=content_length.strip()).isascii() \
+                       or not content_length.isdigit():
+
+                        if self._logger:
+
+                            self._logger.error(f'Invalid Content-Length from \
+{address[0]}:{address[1]}, closing connection.')
+
+                        connection.sendall(self._bad_request_response)
+
+                        connection.close()
+
+                        return None
 
                     content_length = int(content_length)
-                        
-                    while (body_length:=len(raw_request.split(b'\r\n\r\n', 1)[1]))\
-                    < (content_length):
 
-                        raw_request += connection.recv(content_length - body_length)
+                    if self._max_body_size is not None \
+                       and content_length > self._max_body_size:
+
+                        if self._logger:
 
-                    parsed_request = request.Request.from_bytestring(
-                                    address = address,
-                                    request = raw_request)
+                            self._logger.warning(f'Request body from \
+{address[0]}:{address[1]} is too large, closing connection.')
+
+                        connection.sendall(self._too_large_response)
+
+                        connection.close()
+
+                        return None
+
+                    parsed_request._body = None
+
+                    parsed_request._stream = reader.body(content_length)
 
                 if self._logger:
 
                     self._logger.debug(f'Recieved {parsed_request.method} request from \
 {address[0]}:{address[1]} for {parsed_request.path if parsed_request.path else "/"}')
 
-                connection.send(self._get_route(path = parsed_request.path,
-                                                request = parsed_request))
+                message = self._get_route(path = parsed_request.path,
+                                          request = parsed_request)
+
+                if message.chunked and parsed_request.version < 1.1:
+
+                    message.headers.pop('Transfer-Encoding', None)
+
+                    message.headers.pop('transfer-encoding', None)
+
+                response_started = True
+
+                self._send(connection = connection,
+                           message = message)
                 
                 if self._logger:
 
                     self._logger.debug(f'Sent {parsed_request.method} response to \
 {address[0]}:{address[1]} for {parsed_request.path if parsed_request.path else "/"}')
 
-                if not (parsed_request.headers.get('Connection') or \
-                        parsed_request.headers.get('connection')) == 'keep-alive':
+                if not parsed_request.headers.get('Connection') == 'keep-alive' \
+                   or (parsed_request._stream and parsed_request._stream.remaining) \
+                   or (message.is_streamed and not message.chunked \
+                       and 'Content-Length' not in message.headers):
 
                     try:
                 
@@ -234,6 +661,23 @@ class Server(routes.Routes):
 
                     return None
 
+            except TimeoutError:
+
+                if self._logger:
+
+                    self._logger.debug(f'Connection with \
+{address[0]}:{address[1]} timed out.')
+
+                try:
+
+                    connection.close()
+
+                except Exception:
+
+                    pass
+
+                return None
+
             except Exception as e:
 
                 if self._logger:
@@ -243,9 +687,12 @@ class Server(routes.Routes):
 
                 try:
 
-                    connection.send(self._get_route(path = self._500route,
-                                                    request = parsed_request))
-                    
+                    if not response_started:
+
+                        self._send(connection = connection,
+                                   message = self._get_route(path = self._500route,
+                                                             request = parsed_request))
+
                     connection.close()
 
                 except Exception:
@@ -254,6 +701,32 @@ class Server(routes.Routes):
 
                 return None
 
+    def _send(self,
+              connection: socket.socket,
+              message: response.Response) -> None:
+        '''Sends a response on a connection, streaming its body if needed.
+        File responses are sent with sendfile, which falls back to reading
+        the file in chunks on TLS connections. Raises an OSError if the file
+        is shorter than its Content-Length.'''
+
+        if isinstance(message, response.FileResponse) and message.is_streamed:
+
+            connection.sendall(message._head())
+
+            with open(message.filepath, 'rb') as file:
+
+                if connection.sendfile(file,
+                                       offset = message.offset,
+                                       count = message.length) < message.length:
+
+                    raise OSError(f'File "{message.filepath}" shrank while it was sent.')
+
+            return None
+
+        for data in message._iter_bytes():
+
+            connection.sendall(data)
+
     def __enter__(self) -> Self:
         '''Starts the server.'''
 
@@ -1,127 +1,730 @@
+import base64
+import hmac
+import json
+import math
+import os
+import pickle
 import secrets
+import sqlite3
 import threading
 import time
 from typing import Any
 
+from . import cache
+
 class Session:
-     
+
     def __init__(self,
-                 session_id: str) -> None:
+                 session_id: str,
+                 items: dict[str, Any] = None,
+                 expires: float = 0) -> None:
         '''Initializes the session class.'''
-        
+
         self._session_id: str = session_id
-        
-        self._items: dict[str, Any] = {}
+
+        self._items: dict[str, Any] = items if items is not None else {}
+
+        self._expires: float = expires
+
+        self._dirty: bool = False
+
+        self._expires_header: tuple[float, str] = (None, '')
+
+        self._parent: Sessions = None
 
     @property
     def id(self) -> str:
         '''Returns the session id.'''
-        
+
         return self._session_id
-    
+
     def set(self,
             key: str,
             value: Any) -> None:
         '''Adds an item to the session.
         If the item already exists, it is overwritten.'''
-        
+
         self._items[key] = value
 
+        self._dirty = True
+
     def remove(self,
                key: str) -> None:
         '''Removes an item from the session.'''
 
         self._items.pop(key)
 
+        self._dirty = True
+
     def get(self,
             key: str) -> Any:
-        '''Gets an item from the session. Returns "None" if the item does not exist.'''
+        '''Gets an item from the session. Returns "None" if the item does not exist.
+        Changes made to a mutable item in place are only saved if the item is set again.'''
 
         return self._items.get(key)
-    
-    def update(self) -> None: 
-        '''Updates the session id, and resets the timer.'''
 
-        self._parent.remove(self._session_id)
+    def update(self) -> None:
+        '''Updates the session id, and resets the expiry.'''
+
+        self._parent._rotate(self)
+
+    @property
+    def expires(self) -> str:
+        '''Returns the expires in header format.
+        It is only formatted again when the expiry changes.'''
+
+        if self._expires_header[0] != self._expires:
+
+            self._expires_header = (self._expires,
+                                    time.strftime('%a, %d %b %Y %H:%M:%S GMT',
+                                                  time.gmtime(self._expires)))
+
+        return self._expires_header[1]
+
+class LazySession:
+    '''Stands in for the session of a request. The session is only looked up
+    when it is first used, and only created when it is first changed,
+    so requests which do not use it create no session.'''
+
+    def __init__(self,
+                 sessions: 'Sessions | SignedCookieSessions',
+                 session_id: str = None) -> None:
+        '''Initializes the lazy session class.
+
+        :param sessions: The sessions the session is looked up in.
+        :param session_id: The session id sent by the client, if any.'''
+
+        self._sessions: Sessions | SignedCookieSessions = sessions
+
+        self._session_id: str = session_id
+
+        self._session: Session = None
+
+        self._loaded: bool = False
+
+        self._created: bool = False
+
+    def _load(self,
+              create: bool) -> Session:
+        '''Returns the session, looking it up on first use.
+        If it does not exist, it is created if create is True, None is returned otherwise.'''
+
+        if not self._loaded:
+
+            self._loaded = True
+
+            if self._session_id:
+
+                self._session = self._sessions.get(self._session_id)
+
+        if self._session is None and create:
 
-        while self._parent._sessions.get(session_id := secrets.token_urlsafe(128)):
-             pass
-        
-        self._session_id = session_id
+            self._session = self._sessions.get(self._sessions.add())
 
-        self._parent._sessions[self._session_id] = self
+            self._created = True
 
-        remove_timer = threading.Timer(self._parent._remove_after,
-                                       self._parent.remove,
-                                       args = (self._session_id,))
+        return self._session
 
-        self._parent._remove_dict[self._session_id] = remove_timer
+    def _changed(self) -> bool:
+        '''Returns whether the session cookie has to be sent again,
+        because the session is new, was rotated or its expiry moved.'''
 
-        remove_timer.start()
+        if self._session is None:
+
+            return False
+
+        return self._created or self._sessions._sliding_expiration \
+               or self._session.id != self._session_id
+
+    @property
+    def id(self) -> str:
+        '''Returns the session id, creating the session if needed.'''
+
+        return self._load(True).id
+
+    def set(self,
+            key: str,
+            value: Any) -> None:
+        '''Adds an item to the session, creating the session if needed.
+        If the item already exists, it is overwritten.'''
+
+        self._load(True).set(key, value)
+
+    def remove(self,
+               key: str) -> None:
+        '''Removes an item from the session.'''
+
+        if (session:=self._load(False)) is None:
+
+            raise KeyError(key)
+
+        session.remove(key)
+
+    def get(self,
+            key: str) -> Any:
+        '''Gets an item from the session. Returns "None" if the item
+        or the session does not exist.'''
+
+        if (session:=self._load(False)) is None:
+
+            return None
+
+        return session.get(key)
+
+    def update(self) -> None:
+        '''Updates the session id, and resets the expiry.'''
+
+        self._load(True).update()
 
     @property
     def expires(self) -> str:
         '''Returns the expires in header format.'''
 
-        return time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime(self._expires))
+        return self._load(True).expires
+
+class SessionBackend:
+    '''Stores sessions for Sessions. Subclass it to keep sessions elsewhere.
+    Backends must be safe to use from several threads.'''
+
+    def get(self,
+            session_id: str) -> Session:
+        '''Returns a session, or None if it does not exist or expired.'''
+
+        raise NotImplementedError
+
+    def put(self,
+            session: Session) -> None:
+        '''Stores a new or changed session, with its items and expiry.'''
+
+        raise NotImplementedError
+
+    def delete(self,
+               session_id: str) -> None:
+        '''Removes a session. If the session does not exist, nothing happens.'''
+
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        '''Writes the sessions whose write was deferred.'''
+
+        pass
+
+class MemorySessionBackend(SessionBackend):
+    '''Keeps sessions in the memory of the process, in a Cache whose items
+    expire with their session, so no thread is needed per session.'''
+
+    def __init__(self) -> None:
+        '''Initializes the memory session backend class.'''
+
+        self._sessions: cache.Cache = cache.Cache('sessions',
+                                                  reset_on_update = True)
+
+    def get(self,
+            session_id: str) -> Session:
+        '''Returns a session, or None if it does not exist or expired.'''
+
+        return self._sessions.get(session_id)
+
+    def put(self,
+            session: Session) -> None:
+        '''Stores a new or changed session, with its items and expiry.'''
+
+        if (expire:=session._expires - time.time()) <= 0:
+
+            self._sessions.remove(session._session_id)
+
+            return None
+
+        self._sessions.add(cache.CacheItem(session._session_id,
+                                           session,
+                                           expire))
+
+    def delete(self,
+               session_id: str) -> None:
+        '''Removes a session. If the session does not exist, nothing happens.'''
+
+        self._sessions.remove(session_id)
+
+class SQLiteSessionBackend(SessionBackend):
+    '''Keeps sessions in an SQLite database on the local disk,
+    so they survive restarts and are shared between worker processes.
+    Sessions are loaded on every access. Writes of changed sessions are gathered
+    and written in one transaction every write_interval seconds by a daemon thread
+    of each process.'''
+
+    def __init__(self,
+                 path: str = 'sessions.sqlite3',
+                 *,
+                 serializer: Any = pickle,
+                 write_interval: float = 0) -> None:
+        '''Initializes the SQLite session backend class.
+
+        :param path: The path of the database file.
+        :param serializer: The object serializing session items, with dumps
+        and loads functions. Ex: pickle, json.
+        :param write_interval: The time in seconds changed sessions are held
+        before they are written. 0 writes them at the end of each request.'''
+
+        self._path: str = path
+
+        self._serializer: Any = serializer
+
+        self._write_interval: float = write_interval
+
+        self._pending: dict[str, Session] = {}
+
+        self._deleted: set[str] = set()
+
+        self._flusher_pid: int = None
+
+        self._lock: threading.Lock = threading.Lock()
+
+        self._write_lock: threading.Lock = threading.Lock()
+
+        self._local: threading.local = threading.local()
+
+        with self._connection() as connection:
+
+            connection.execute('CREATE TABLE IF NOT EXISTS sessions '
+                               '(id TEXT PRIMARY KEY, data BLOB, expires REAL)')
+
+    def _connection(self) -> sqlite3.Connection:
+        '''Returns the connection of the current thread,
+        opening a new one in new threads and forked processes.'''
+
+        if getattr(self._local, 'pid', None) != os.getpid():
+
+            self._local.connection = sqlite3.connect(self._path, timeout = 30)
+
+            self._local.connection.execute('PRAGMA journal_mode=WAL')
+
+            self._local.pid = os.getpid()
+
+        return self._local.connection
+
+    def _start_flusher(self) -> None:
+        '''Starts the thread writing deferred sessions, once in every process.'''
+
+        with self._lock:
+
+            if self._flusher_pid == os.getpid():
+
+                return None
+
+            self._flusher_pid = os.getpid()
+
+        threading.Thread(target = self._flush_periodically,
+                         daemon = True).start()
+
+    def _flush_periodically(self) -> None:
+        '''Writes the deferred sessions every write_interval seconds.
+        Failed writes are tried again on the next interval.'''
+
+        while True:
+
+            time.sleep(self._write_interval)
+
+            if self._pending or self._deleted:
+
+                try:
+
+                    self.flush()
+
+                except sqlite3.Error:
+
+                    pass
+
+    def get(self,
+            session_id: str) -> Session:
+        '''Returns a session, or None if it does not exist or expired.'''
+
+        with self._lock:
+
+            if session_id in self._deleted:
+
+                return None
+
+            if (session:=self._pending.get(session_id)):
+
+                return session if session._expires > time.time() else None
+
+        row = self._connection().execute('SELECT data, expires FROM sessions '
+                                         'WHERE id = ? AND expires > ?',
+                                         (session_id, time.time())).fetchone()
+
+        if row is None:
+
+            return None
+
+        return Session(session_id,
+                       items = self._serializer.loads(row[0]),
+                       expires = row[1])
+
+    def put(self,
+            session: Session) -> None:
+        '''Stores a new or changed session, with its items and expiry.'''
+
+        with self._lock:
+
+            self._deleted.discard(session._session_id)
+
+            self._pending[session._session_id] = session
+
+        if not self._write_interval:
+
+            self.flush()
+
+        else:
+
+            self._start_flusher()
+
+    def delete(self,
+               session_id: str) -> None:
+        '''Removes a session. If the session does not exist, nothing happens.'''
+
+        with self._lock:
+
+            self._pending.pop(session_id, None)
+
+            self._deleted.add(session_id)
+
+        if not self._write_interval:
+
+            self.flush()
+
+        else:
+
+            self._start_flusher()
+
+    def flush(self) -> None:
+        '''Writes the changed and removed sessions, and removes expired ones.
+        If the write fails, the sessions are kept to be written again.'''
+
+        with self._write_lock:
+
+            with self._lock:
+
+                pending, self._pending = self._pending, {}
+
+                deleted, self._deleted = self._deleted, set()
+
+            try:
+
+                rows = [(session_id, self._serializer.dumps(session._items),
+                         session._expires)
+                        for session_id, session in pending.items()]
+
+                with self._connection() as connection:
+
+                    connection.executemany('INSERT OR REPLACE INTO sessions '
+                                           '(id, data, expires) VALUES (?, ?, ?)', rows)
+
+                    connection.executemany('DELETE FROM sessions WHERE id = ?',
+                                           [(session_id,) for session_id in deleted])
+
+                    connection.execute('DELETE FROM sessions WHERE expires <= ?',
+                                       (time.time(),))
+
+            except Exception:
+
+                with self._lock:
+
+                    self._pending = {**{session_id: session
+                                        for session_id, session in pending.items()
+                                        if session_id not in self._deleted},
+                                     **self._pending}
+
+                    self._deleted |= deleted - self._pending.keys()
+
+                raise
 
 class Sessions:
+    '''Stores sessions until they expire, in a session backend.'''
 
     def __init__(self,
-                 remove_after: float = 900) -> None:
+                 remove_after: float = 900,
+                 sliding_expiration: bool = False,
+                 backend: SessionBackend = None) -> None:
         '''Sessions class for storing sessions.
-        :param remove_after: The time in seconds after which a session is removed.'''
-        
-        self._sessions: dict[str, Session] = {}
-
-        self._remove_dict: dict[str, threading.Timer] = {}
+        :param remove_after: The time in seconds after which a session is removed.
+        :param sliding_expiration: Whether the time is counted from the last
+        access to the session rather than from its creation.
+        :param backend: Where the sessions are kept. Defaults to the memory
+        of the process.'''
 
         self._remove_after: float = remove_after
 
-    def add(self) -> None:
-        '''Adds a session to the sessions.'''
+        self._sliding_expiration: bool = sliding_expiration
+
+        self._backend: SessionBackend = backend or MemorySessionBackend()
 
-        while self._sessions.get(session_id := secrets.token_urlsafe(128)):
+    def _new_id(self) -> str:
+        '''Returns a session id which is not in use.'''
+
+        while self._backend.get(session_id := secrets.token_urlsafe(128)):
             pass
 
-        self._sessions[session_id] = Session(session_id)
+        return session_id
+
+    def _rotate(self,
+                session: Session) -> None:
+        '''Gives a session a new id and resets its expiry.'''
+
+        self._backend.delete(session._session_id)
 
-        self._sessions[session_id]._parent = self
+        session._session_id = self._new_id()
 
-        remove_timer: threading.Timer = threading.Timer(self._remove_after,
-                        self.remove,
-                        args = (session_id,))
-        
-        self._remove_dict[session_id] = remove_timer
+        session._expires = time.time() + self._remove_after
 
-        remove_timer.start()
+        self._backend.put(session)
 
-        self._sessions[session_id]._expires = time.time() + self._remove_after
+        session._dirty = False
+
+    def add(self) -> str:
+        '''Adds a session to the sessions.'''
+
+        session_id = self._new_id()
+
+        session = Session(session_id,
+                          expires = time.time() + self._remove_after)
+
+        session._parent = self
+
+        self._backend.put(session)
 
         return session_id
 
     def remove(self,
                session_id: str) -> None:
-          '''Removes a session from the sessions.'''
-    
-          try:
-                
-                self._remove_dict.pop(session_id).cancel()
-    
-                self._sessions.pop(session_id)
-    
-          except Exception:
-    
-                pass
-          
+        '''Removes a session from the sessions.'''
+
+        self._backend.delete(session_id)
+
     def exists(self,
                session_id: str) -> bool:
-          '''Checks if a session exists.'''
-    
-          return session_id in self._sessions
-    
+        '''Checks if a session exists.'''
+
+        return self._backend.get(session_id) is not None
+
     def get(self,
             session_id: str) -> Session:
-          '''Gets a session from the sessions.'''
-    
-          return self._sessions.get(session_id)
\ No newline at end of file
+        '''Gets a session from the sessions.
+        With sliding expiration, the expiry of the session is reset.'''
+
+        if (session:=self._backend.get(session_id)):
+
+            session._parent = self
+
+            if self._sliding_expiration:
+
+                session._expires = time.time() + self._remove_after
+
+                self._backend.put(session)
+
+        return session
+
+    def save(self,
+             session: Session) -> None:
+        '''Stores the changes made to a session.'''
+
+        if session._dirty:
+
+            self._backend.put(session)
+
+            session._dirty = False
+
+    def flush(self) -> None:
+        '''Writes the sessions whose write was deferred by the backend.'''
+
+        self._backend.flush()
+
+class CookieSession(Session):
+    '''A session whose items are stored in its signed cookie.
+    The items are only decoded when the session is first read or changed.'''
+
+    def __init__(self,
+                 parent: 'SignedCookieSessions',
+                 *,
+                 token: str = None,
+                 payload: str = None,
+                 expires: float = 0) -> None:
+        '''Initializes the cookie session class.
+
+        :param parent: The sessions the session belongs to.
+        :param token: The signed cookie value the session was read from.
+        :param payload: The encoded items of the session.
+        :param expires: The time the session expires at.'''
+
+        self._payload: str = payload
+
+        super().__init__(token,
+                         expires = expires)
+
+        self._parent: SignedCookieSessions = parent
+
+    @property
+    def _items(self) -> dict[str, Any]:
+        '''Returns the items of the session, decoding them on first access.'''
+
+        if self._decoded is None:
+
+            self._decoded = json.loads(base64.urlsafe_b64decode(self._payload + '==')) \
+                            if self._payload else {}
+
+        return self._decoded
+
+    @_items.setter
+    def _items(self,
+               items: dict[str, Any]) -> None:
+        '''Sets the items of the session.'''
+
+        self._decoded = items or None
+
+    @property
+    def id(self) -> str:
+        '''Returns the signed cookie value of the session,
+        encoding it again if the session changed.'''
+
+        if self._session_id is None:
+
+            self._session_id = self._parent._encode(self)
+
+        return self._session_id
+
+    def set(self,
+            key: str,
+            value: Any) -> None:
+        '''Adds an item to the session.
+        If the item already exists, it is overwritten.'''
+
+        super().set(key, value)
+
+        self._session_id = None
+
+    def remove(self,
+               key: str) -> None:
+        '''Removes an item from the session.'''
+
+        super().remove(key)
+
+        self._session_id = None
+
+class SignedCookieSessions:
+    '''Stores sessions in the cookie sent to the client, serialized as JSON
+    and signed with HMAC-SHA256, so no state is kept on the server.
+    Sessions can not be removed before they expire, and their items must be
+    JSON serializable and fit in a cookie.'''
+
+    MAX_COOKIE_SIZE = 4096
+
+    def __init__(self,
+                 secret: bytes,
+                 remove_after: float = 900,
+                 sliding_expiration: bool = False) -> None:
+        '''Initializes the signed cookie sessions class.
+
+        :param secret: The key the cookies are signed with.
+        :param remove_after: The time in seconds after which a session expires.
+        :param sliding_expiration: Whether the time is counted from the last
+        access to the session rather than from its creation.'''
+
+        self._secret: bytes = secret
+
+        self._remove_after: float = remove_after
+
+        self._sliding_expiration: bool = sliding_expiration
+
+    def _sign(self,
+              data: str) -> str:
+        '''Returns the signature of data.'''
+
+        return base64.urlsafe_b64encode(hmac.digest(self._secret,
+                                                    data.encode(),
+                                                    'sha256')).decode().rstrip('=')
+
+    def _encode(self,
+                session: CookieSession) -> str:
+        '''Returns the signed cookie value of a session.'''
+
+        if session._decoded is not None:
+
+            session._payload = base64.urlsafe_b64encode(
+                json.dumps(session._decoded,
+                           separators = (',', ':')).encode()).decode().rstrip('=')
+
+        data = f'{math.ceil(session._expires):x}.{session._payload or ""}'
+
+        if len(token:=f'{data}.{self._sign(data)}') > self.MAX_COOKIE_SIZE:
+
+            raise ValueError('Session is too large to be stored in a cookie.')
+
+        return token
+
+    def _rotate(self,
+                session: CookieSession) -> None:
+        '''Resets the expiry of a session.'''
+
+        session._expires = time.time() + self._remove_after
+
+        session._session_id = None
+
+    def add(self) -> str:
+        '''Returns the signed cookie value of a new empty session.'''
+
+        return CookieSession(self,
+                             expires = time.time() + self._remove_after).id
+
+    def remove(self,
+               session_id: str) -> None:
+        '''Does nothing, as the session is only stored by the client.'''
+
+        pass
+
+    def exists(self,
+               session_id: str) -> bool:
+        '''Checks if a signed cookie value holds a valid session.'''
+
+        return self.get(session_id) is not None
+
+    def get(self,
+            session_id: str) -> CookieSession:
+        '''Gets the session stored in a signed cookie value,
+        or None if it was tampered with or expired.
+        With sliding expiration, the expiry of the session is reset.'''
+
+        try:
+
+            data, _, signature = session_id.rpartition('.')
+
+            expires, _, payload = data.partition('.')
+
+            if not hmac.compare_digest(signature.encode(), self._sign(data).encode()) \
+               or int(expires, 16) <= time.time():
+
+                return None
+
+        except (AttributeError, ValueError):
+
+            return None
+
+        session = CookieSession(self,
+                                token = session_id,
+                                payload = payload,
+                                expires = int(expires, 16))
+
+        if self._sliding_expiration:
+
+            self._rotate(session)
+
+        return session
+
+    def save(self,
+             session: CookieSession) -> None:
+        '''Does nothing, as the session is written to its cookie.'''
+
+        pass
+
+    def flush(self) -> None:
+        '''Does nothing, as no session is written on the server.'''
+
+        pass
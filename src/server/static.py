@@ -0,0 +1,298 @@
+import collections
+import email.utils
+import mimetypes
+import os
+import threading
+import time
+
+from . import compression
+from . import request
+from . import response
+from . import response_codes
+from . import response_messages
+
+class StaticFile:
+    '''Precomputed metadata, headers and content of a static file.'''
+
+    def __init__(self,
+                 filepath: str,
+                 stat: os.stat_result,
+                 *,
+                 cache_control: str,
+                 max_file_size: int) -> None:
+        '''Initializes the static file class.
+
+        :param filepath: The path of the file.
+        :param stat: The result of os.stat on the file.
+        :param cache_control: The value of the Cache-Control header.
+        :param max_file_size: The largest file in bytes whose content is kept.'''
+
+        self.filepath: str = filepath
+
+        self.size: int = stat.st_size
+
+        self.mtime_ns: int = stat.st_mtime_ns
+
+        self.modified: int = int(stat.st_mtime)
+
+        self.etag: str = f'"{self.size:x}-{self.mtime_ns:x}"'
+
+        self.checked: float = time.monotonic()
+
+        self.headers: dict[str, str] = {
+            'ETag': self.etag,
+            'Last-Modified': email.utils.formatdate(self.modified, usegmt = True),
+            'Cache-Control': cache_control,
+            'Accept-Ranges': 'bytes',
+        }
+
+        self.content_type: str = mimetypes.guess_type(filepath)[0] \
+                                 or 'application/octet-stream'
+
+        self.body: bytes = None
+
+        self.variants: dict[str, bytes | str] = {}
+
+        if self.size <= max_file_size:
+
+            with open(filepath, 'rb') as file:
+
+                self.body = file.read()
+
+    @property
+    def cost(self) -> int:
+        '''Returns the approximate memory used by the entry in bytes.'''
+
+        return 512 + (len(self.body) if self.body is not None else 0) \
+               + sum(len(variant) for variant in self.variants.values()
+                     if isinstance(variant, bytes))
+
+    def matches(self,
+                stat: os.stat_result) -> bool:
+        '''Returns whether the file is unchanged since the entry was made.'''
+
+        return stat.st_mtime_ns == self.mtime_ns and stat.st_size == self.size
+
+    def not_modified(self,
+                     request: request.Request) -> bool:
+        '''Returns whether the client's cached copy of the file is still valid.'''
+
+        if (if_none_match:=request.headers.get('If-None-Match')):
+
+            return any(tag.strip().removeprefix('W/') in (self.etag, '*')
+                       for tag in if_none_match.split(','))
+
+        if (if_modified_since:=request.headers.get('If-Modified-Since')):
+
+            try:
+
+                return self.modified <= \
+                       email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+
+            except (TypeError, ValueError):
+
+                return False
+
+        return False
+
+class StaticCache:
+    '''Caches static files in memory, bounded by a byte budget with LRU eviction.
+    Entries are revalidated against the file's mtime and size.
+    Compressible files are compressed once per encoding and the result is cached,
+    files too large to be cached are sent from a precompressed .gz or .br file
+    next to them if there is one.'''
+
+    def __init__(self,
+                 *,
+                 max_bytes: int = 33554432,
+                 max_file_size: int = 1048576,
+                 revalidate_after: float = 1,
+                 cache_control: str = 'public, max-age=0, must-revalidate',
+                 compression_min_size: int = 1024) -> None:
+        '''Initializes the static cache class.
+
+        :param max_bytes: The memory budget of the cache in bytes.
+        :param max_file_size: The largest file in bytes whose content is kept
+        in memory, larger files are sent from disk.
+        :param revalidate_after: The time in seconds an entry is trusted
+        before the file is checked for changes again.
+        :param cache_control: The Cache-Control header sent with static files.
+        :param compression_min_size: The smallest file in bytes which is compressed.
+        If None, files are never compressed.'''
+
+        self._max_bytes: int = max_bytes
+
+        self._max_file_size: int = min(max_file_size, max_bytes)
+
+        self._revalidate_after: float = revalidate_after
+
+        self._cache_control: str = cache_control
+
+        self._compression_min_size: int = compression_min_size
+
+        self._entries: collections.OrderedDict[str, StaticFile] = \
+        collections.OrderedDict()
+
+        self._size: int = 0
+
+        self._lock: threading.Lock = threading.Lock()
+
+    def get(self,
+            filepath: str) -> StaticFile:
+        '''Returns the entry of a file, loading it again if it changed.'''
+
+        with self._lock:
+
+            if (entry:=self._entries.get(filepath)):
+
+                self._entries.move_to_end(filepath)
+
+                if time.monotonic() - entry.checked < self._revalidate_after:
+
+                    return entry
+
+        stat = os.stat(filepath)
+
+        if entry and entry.matches(stat):
+
+            entry.checked = time.monotonic()
+
+            return entry
+
+        entry = StaticFile(filepath,
+                           stat,
+                           cache_control = self._cache_control,
+                           max_file_size = self._max_file_size)
+
+        with self._lock:
+
+            if (old_entry:=self._entries.pop(filepath, None)):
+
+                self._size -= old_entry.cost
+
+            self._entries[filepath] = entry
+
+            self._size += entry.cost
+
+            while self._size > self._max_bytes and self._entries:
+
+                self._size -= self._entries.popitem(last = False)[1].cost
+
+        return entry
+
+    def _variant(self,
+                 entry: StaticFile,
+                 encoding: str) -> bytes | str:
+        '''Returns the body of a file compressed with an encoding,
+        or the path of a precompressed file holding it, or None if there is none.'''
+
+        if encoding in entry.variants:
+
+            return entry.variants[encoding]
+
+        variant = None
+
+        if entry.body is not None:
+
+            variant = compression.compress(entry.body, encoding)
+
+            if len(variant) >= entry.size:
+
+                variant = None
+
+        elif (extension:=compression.EXTENSIONS.get(encoding)):
+
+            try:
+
+                if os.stat(entry.filepath + extension).st_mtime_ns >= entry.mtime_ns:
+
+                    variant = entry.filepath + extension
+
+            except OSError:
+
+                pass
+
+        with self._lock:
+
+            entry.variants[encoding] = variant
+
+            if isinstance(variant, bytes) and self._entries.get(entry.filepath) is entry:
+
+                self._size += len(variant)
+
+                while self._size > self._max_bytes and self._entries:
+
+                    self._size -= self._entries.popitem(last = False)[1].cost
+
+        return variant
+
+    def response(self,
+                 filepath: str,
+                 request: request.Request) -> response.Response:
+        '''Returns the response to a request for a static file,
+        a body-less 304 if the client's copy is still valid.
+        The body is compressed if the client accepts it.'''
+
+        entry = self.get(filepath)
+
+        headers = dict(entry.headers)
+
+        encoding = None
+
+        if self._compression_min_size is not None \
+           and entry.size >= self._compression_min_size \
+           and compression.compressible(entry.content_type):
+
+            compression.add_vary(headers)
+
+            if 'Range' not in request.headers:
+
+                encoding = compression.negotiate(request.headers.get('Accept-Encoding'))
+
+        if entry.not_modified(request):
+
+            return response.Response(version = 1.1,
+                                     code = response_codes.ResponseCodes.NOT_MODIFIED,
+                                     message = response_messages.ResponseMessages.NOT_MODIFIED,
+                                     headers = headers)
+
+        headers['Content-Type'] = entry.content_type
+
+        if encoding and (variant:=self._variant(entry, encoding)) is not None:
+
+            if isinstance(variant, str):
+
+                message = response.FileResponse(version = 1.1,
+                                                code = response_codes.ResponseCodes.OK,
+                                                message = response_messages.ResponseMessages.OK,
+                                                headers = headers,
+                                                filepath = variant)
+
+                compression.encode_headers(message.headers, encoding, message.length)
+
+                return message
+
+            compression.encode_headers(headers, encoding, len(variant))
+
+            return response.Response(version = 1.1,
+                                     code = response_codes.ResponseCodes.OK,
+                                     message = response_messages.ResponseMessages.OK,
+                                     headers = headers,
+                                     body = variant)
+
+        if entry.body is None:
+
+            return response.FileResponse(version = 1.1,
+                                         code = response_codes.ResponseCodes.OK,
+                                         message = response_messages.ResponseMessages.OK,
+                                         headers = headers,
+                                         filepath = filepath,
+                                         length = entry.size)
+
+        headers['Content-Length'] = str(entry.size)
+
+        return response.Response(version = 1.1,
+                                 code = response_codes.ResponseCodes.OK,
+                                 message = response_messages.ResponseMessages.OK,
+                                 headers = headers,
+                                 body = entry.body)
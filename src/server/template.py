@@ -1,43 +1,149 @@
+import builtins
+import os
 import re
+import threading
+import types
+from typing import Any, Iterator
+
+_TEMPLATE_SPOT = re.compile(r'({{.*?}})', re.DOTALL)
 
 class TemplateError(Exception):
     '''Raised when there is an error whilst rendering a template.'''
 
     pass
 
-def _template(data: str,
-             **templated_values: dict) -> str:
-    '''Returns the contents of a template file with the templated variables'''
-    
-    if not templated_values:
-        
-        templated_values = {}
+class Template:
+    '''A template parsed and compiled once, then rendered by joining its fragments.
+    Text between the templated spots is kept as is, and each spot is compiled
+    to the code of a function returning the value to insert.'''
+
+    __slots__ = ('_fragments',)
+
+    def __init__(self,
+                 data: str) -> None:
+        '''Initializes the template class.
+
+        :param data: The contents of the template file.'''
+
+        self._fragments: list[str | tuple[str, types.CodeType]] = []
+
+        for index, fragment in enumerate(_TEMPLATE_SPOT.split(data)):
+
+            if index % 2 == 0:
+
+                if fragment:
+
+                    self._fragments.append(fragment)
+
+                continue
+
+            template_spot_indented = \
+'\n    '.join([line for line in fragment.split('\n')])
+
+            output = {}
+
+            try:
+
+                exec(compile(f'''def template_item():
+    {template_spot_indented.strip('{}')}''', '<template>', 'exec'), {}, output)
+
+            except Exception as e:
+
+                raise TemplateError(f'''Error in template:
+
+{fragment}
+
+{e}''')
+
+            self._fragments.append((fragment, output['template_item'].__code__))
+
+    def stream(self,
+               *,
+               buffer_size: int = 16384,
+               **templated_values: dict[str, Any]) -> Iterator[str]:
+        '''Yields the template with the templated spots filled in as it is rendered.
+        Fragments are gathered until about buffer_size characters are pending,
+        so the client gets a few large chunks rather than many small ones.
+
+        :param buffer_size: The number of characters gathered before they are yielded.'''
+
+        namespace = {'__builtins__': builtins, **templated_values}
+
+        pending = []
+
+        pending_size = 0
 
-    template_spots = re.findall(r'{{.*?}}',
-                                data,
-                                re.DOTALL)
-    
-    for template_spot in template_spots:
+        for fragment in self._fragments:
 
-        template_spot_indented = \
-'\n    '.join([line for line in template_spot.split('\n')])
-        
-        output = {}
+            if not isinstance(fragment, str):
 
-        try:
+                template_spot, code = fragment
 
-            exec(f'''def template_item():
-    {template_spot_indented.strip('{}')}
-output= template_item()''', templated_values, output)
-            
-        except Exception as e:
+                try:
 
-            raise TemplateError(f'''Error in template:
+                    fragment = str(types.FunctionType(code, namespace)())
+
+                except Exception as e:
+
+                    raise TemplateError(f'''Error in template:
 
 {template_spot}
 
 {e}''')
-        
-        data = data.replace(template_spot, str(output['output']))
 
-    return data
\ No newline at end of file
+            pending.append(fragment)
+
+            pending_size += len(fragment)
+
+            if pending_size >= buffer_size:
+
+                yield ''.join(pending)
+
+                pending = []
+
+                pending_size = 0
+
+        if pending:
+
+            yield ''.join(pending)
+
+    def render(self,
+               **templated_values: dict[str, Any]) -> str:
+        '''Returns the template with the templated spots filled in.'''
+
+        return ''.join(self.stream(buffer_size = float('inf'),
+                                   **templated_values))
+
+_compiled: dict[str, tuple[int, int, Template]] = {}
+
+_compiled_lock: threading.Lock = threading.Lock()
+
+def load(filepath: str) -> Template:
+    '''Returns the compiled template of a file.
+    Templates are kept in memory and only compiled again when the file changes.'''
+
+    stat = os.stat(filepath)
+
+    with _compiled_lock:
+
+        if (entry:=_compiled.get(filepath)) \
+           and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+
+            return entry[2]
+
+    with open(filepath, 'rb') as file:
+
+        compiled = Template(file.read().decode(encoding = 'utf-8',
+                                               errors = 'ignore'))
+
+    with _compiled_lock:
+
+        _compiled[filepath] = (stat.st_mtime_ns, stat.st_size, compiled)
+
+    return compiled
+
+def _template(data: str,
+             **templated_values: dict) -> str:
+    '''Returns the contents of a template file with the templated variables'''
+
+    return Template(data).render(**templated_values)